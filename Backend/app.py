@@ -1,17 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 import bcrypt
 from datetime import datetime, timedelta
 import secrets
 import os
+import io
+import csv
+import json
+import tempfile
+import time
 from dotenv import load_dotenv
-import pickle
 import numpy as np
-import pandas as pd
 from bson.objectid import ObjectId
-from threading import Lock
+from threading import Lock, Thread
+import sys
+
+sys.path.insert(0, 'src')
+
+from batch_dedup import BatchDedupStats, fingerprint_upload, unique_rows
+from batch_jobs import BatchJobQueue, JobQueueFull, new_batch_summary, accumulate_batch_summary
+from feature_pipeline import CONFIRMED_LABELS, FEATURE_COLUMNS
+from inference_policy import ParallelInference
+from input_validation import validate_frame
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache
+from request_coalescer import PredictionCoalescer
+from sharded_inference import ShardedInferencePool
+from upload_formats import UploadFormatError, iter_upload_chunks, read_upload, upload_extension
 
 load_dotenv()
 
@@ -19,28 +37,84 @@ app = Flask(__name__)
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins='*')
 
-# Load the trained model
+MODEL_PATH = 'models/random_forest_ckd.pkl'
+
+def model_name_for(pickle_path):
+    """Registry name of a model artifact: its file name without the extension"""
+    return os.path.splitext(os.path.basename(pickle_path))[0]
+
+
+def format_prediction(prediction):
+    """Convert a model class label to its readable result"""
+    return 'CKD' if prediction == 0 else 'No CKD'
+
+
+# Load the trained model (the memory-mapped copy is shared between worker processes).
+# New artifacts in models/ are picked up and swapped in without a restart.
+# Extra artifacts listed in SHADOW_MODELS score the same inputs in the background for comparison.
+model_registry = ModelRegistry(
+    os.path.dirname(MODEL_PATH),
+    poll_seconds=float(os.getenv('MODEL_RELOAD_POLL_SECONDS', '10')),
+    shadow_queue_rows=int(os.getenv('SHADOW_QUEUE_ROWS', '5000')),
+    shadow_sample_rows=int(os.getenv('SHADOW_BATCH_SAMPLE_ROWS', '500')),
+    format_label=format_prediction
+)
 try:
-    with open('models/random_forest_ckd.pkl', 'rb') as f:
-        loaded_model = pickle.load(f)
-    
-    # Check if it's a dict with model and other components
-    if isinstance(loaded_model, dict):
-        model = loaded_model.get('model')
-        scaler = loaded_model.get('scaler')
-        feature_selector = loaded_model.get('selector')  # Note: key is 'selector' not 'feature_selector'
-        print(f"Model loaded from dict with keys: {loaded_model.keys()}")
-    else:
-        model = loaded_model
-        scaler = None
-        feature_selector = None
-    
+    model_registry.register(model_name_for(MODEL_PATH), MODEL_PATH, primary=True)
     print("Model loaded successfully!")
 except Exception as e:
     print(f"Error loading model: {e}")
-    model = None
-    scaler = None
-    feature_selector = None
+
+for shadow_path in filter(None, (path.strip() for path in os.getenv('SHADOW_MODELS', '').split(','))):
+    try:
+        model_registry.register(model_name_for(shadow_path), shadow_path)
+        print(f"Shadow model {shadow_path} loaded")
+    except Exception as e:
+        print(f"Error loading shadow model {shadow_path}: {e}")
+
+# Large batches are scored on several threads; the row threshold is calibrated at startup
+# unless INFERENCE_MIN_ROWS_PER_WORKER is set
+inference_policy = ParallelInference(
+    max_workers=int(os.getenv('INFERENCE_MAX_WORKERS', '0')) or None,
+    min_rows_per_worker=int(os.getenv('INFERENCE_MIN_ROWS_PER_WORKER', '0')) or None
+)
+if inference_policy.min_rows_per_worker is None and model_registry.current() is not None:
+    calibration_model = model_registry.current()
+    Thread(
+        target=inference_policy.calibrate,
+        args=(calibration_model.score, calibration_model.transform({}).shape[1]),
+        name='inference-calibration',
+        daemon=True
+    ).start()
+
+# Very large batches can be scored in worker processes instead (off unless BATCH_PROCESS_WORKERS > 0)
+BATCH_PROCESS_WORKERS = int(os.getenv('BATCH_PROCESS_WORKERS', '0'))
+BATCH_PROCESS_MIN_ROWS = int(os.getenv('BATCH_PROCESS_MIN_ROWS', '50000'))
+
+sharded_inference = None
+if BATCH_PROCESS_WORKERS > 0:
+    try:
+        sharded_inference = ShardedInferencePool(MODEL_PATH, BATCH_PROCESS_WORKERS).start()
+        print(f"Started {BATCH_PROCESS_WORKERS} batch scoring processes")
+    except Exception as e:
+        print(f"Error starting batch scoring processes: {e}")
+
+# Resubmitted panels are answered from an LRU+TTL cache keyed on features and model version
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv('PREDICTION_CACHE_SIZE', '10000')),
+    ttl_seconds=int(os.getenv('PREDICTION_CACHE_TTL_SECONDS', '3600')),
+    artifact_path=MODEL_PATH
+)
+
+# A repeat batch upload (same file, same user, same model) returns the first upload's results.
+# Entries are weighted by their result rows, so a few large uploads cannot pin unbounded memory.
+upload_cache = PredictionCache(
+    max_entries=int(os.getenv('UPLOAD_CACHE_SIZE', '32')),
+    ttl_seconds=int(os.getenv('UPLOAD_CACHE_TTL_SECONDS', '3600')),
+    artifact_path=MODEL_PATH,
+    max_weight=int(os.getenv('UPLOAD_CACHE_MAX_ROWS', '100000'))
+)
+batch_dedup_stats = BatchDedupStats()
 
 # MongoDB connection
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
@@ -54,6 +128,17 @@ predictions_collection = db['predictions']  # Add predictions collection
 doctor_accounts_collection = db['doctor_accounts']
 doctor_sessions_collection = db['doctor_sessions']
 
+# Number of batch prediction records written per bulk insert
+BATCH_INSERT_CHUNK_SIZE = int(os.getenv('BATCH_INSERT_CHUNK_SIZE', '1000'))
+
+# Number of CSV rows read, scored and streamed back at a time by /api/predict-batch/stream
+BATCH_STREAM_CHUNK_SIZE = int(os.getenv('BATCH_STREAM_CHUNK_SIZE', '5000'))
+
+# Background batch jobs: worker pool size, queued/running job limit and result retention
+BATCH_JOB_WORKERS = int(os.getenv('BATCH_JOB_WORKERS', '2'))
+BATCH_JOB_MAX_PENDING = int(os.getenv('BATCH_JOB_MAX_PENDING', '20'))
+BATCH_JOB_RETENTION_SECONDS = int(os.getenv('BATCH_JOB_RETENTION_SECONDS', '3600'))
+
 # Admin secret code (change this in production!)
 ADMIN_SECRET_CODE = os.getenv('ADMIN_SECRET_CODE', 'CKD_ADMIN_2026')
 
@@ -67,6 +152,8 @@ admin_sessions_collection.create_index('expires_at', expireAfterSeconds=0)
 doctor_accounts_collection.create_index('email', unique=True)
 doctor_sessions_collection.create_index('token', unique=True)
 doctor_sessions_collection.create_index('expires_at', expireAfterSeconds=0)
+# The retraining job reads confirmed predictions in confirmation order
+predictions_collection.create_index('confirmed_at', sparse=True)
 
 # Collections for consultations
 doctors_collection = db['doctors']
@@ -678,6 +765,50 @@ def doctor_patient_predictions(user_id):
         return jsonify({'message': f'Server error: {str(e)}'}), 500
 
 
+@app.route('/api/doctor/predictions/<prediction_id>/confirm', methods=['POST'])
+def doctor_confirm_prediction(prediction_id):
+    """Record a clinician's confirmed diagnosis for a stored prediction (used for retraining)"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+
+        # Labels feed the next model, so confirming always needs a doctor session
+        session = get_doctor_session(token)
+        if not session:
+            return jsonify({'message': 'Invalid or expired token'}), 401
+
+        data = request.get_json(silent=True) or {}
+        diagnosis = data.get('diagnosis')
+        if diagnosis not in CONFIRMED_LABELS:
+            return jsonify({'message': f"diagnosis must be one of: {', '.join(CONFIRMED_LABELS)}"}), 400
+
+        try:
+            record_id = ObjectId(prediction_id)
+        except Exception:
+            return jsonify({'message': 'Invalid prediction id'}), 400
+
+        confirmed_at = datetime.utcnow()
+        result = predictions_collection.update_one(
+            {'_id': record_id},
+            {'$set': {
+                'confirmed_label': diagnosis,
+                'confirmed_by': session['doctor_id'],
+                'confirmed_at': confirmed_at
+            }}
+        )
+        if result.matched_count == 0:
+            return jsonify({'message': 'Prediction not found'}), 404
+
+        return jsonify({
+            'message': 'Diagnosis confirmed',
+            'prediction_id': prediction_id,
+            'confirmed_label': diagnosis,
+            'confirmed_at': confirmed_at
+        }), 200
+
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
 @app.route('/api/doctor/seed', methods=['POST'])
 def seed_doctor_accounts():
     """Seed default doctor login accounts (development helper)."""
@@ -1214,55 +1345,382 @@ def admin_reports_summary():
         return jsonify({'message': f'Server error: {str(e)}'}), 500
 
 
-def preprocess_input(data):
-    """Preprocess input data for prediction"""
-    # Define expected features
-    feature_names = ['age', 'bp', 'sg', 'al', 'su', 'bgr', 'bu', 'sc', 'sod', 'pot', 
-                     'hemo', 'pcv', 'wc', 'rc', 'rbc', 'pc', 'pcc', 'ba', 'htn', 'dm', 
-                     'cad', 'appet', 'pe', 'ane']
+@app.route('/api/admin/prediction-cache', methods=['GET', 'DELETE'])
+def admin_prediction_cache():
+    """Get prediction cache counters, or clear the cache"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify admin session
+        admin_session = admin_sessions_collection.find_one({'token': token})
+        
+        if not admin_session or admin_session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        if request.method == 'DELETE':
+            prediction_cache.invalidate()
+            upload_cache.invalidate()
+            return jsonify({
+                'message': 'Prediction cache cleared',
+                'cache': prediction_cache.stats(),
+                'uploads': upload_cache.stats()
+            }), 200
+        
+        return jsonify({
+            'cache': prediction_cache.stats(),
+            'uploads': upload_cache.stats(),
+            'batch_dedup': batch_dedup_stats.stats(),
+            'coalescer': prediction_coalescer.stats() if prediction_coalescer is not None else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/admin/model', methods=['GET'])
+def admin_model_status():
+    """Get the served model version and reload status"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify admin session
+        admin_session = admin_sessions_collection.find_one({'token': token})
+        
+        if not admin_session or admin_session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        return jsonify({
+            'model': model_registry.primary_manager().status(),
+            'inference': inference_policy.stats(),
+            'batch_processes': sharded_inference.stats() if sharded_inference is not None else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/admin/model/reload', methods=['POST'])
+def admin_reload_model():
+    """Load the model artifact from disk and swap it in without dropping requests"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify admin session
+        admin_session = admin_sessions_collection.find_one({'token': token})
+        
+        if not admin_session or admin_session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        force = bool((request.get_json(silent=True) or {}).get('force', False))
+        
+        try:
+            changed = model_registry.primary_manager().reload(force=force)
+        except Exception as e:
+            return jsonify({
+                'message': f'Reload failed, still serving the previous model: {str(e)}',
+                'model': model_registry.primary_manager().status()
+            }), 500
+        
+        return jsonify({
+            'message': 'Model reloaded' if changed else 'Model artifact unchanged',
+            'reloaded': changed,
+            'model': model_registry.primary_manager().status()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/admin/models', methods=['GET', 'POST'])
+def admin_models():
+    """List registered models with their latency and agreement comparison, or register a shadow model"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify admin session
+        admin_session = admin_sessions_collection.find_one({'token': token})
+        
+        if not admin_session or admin_session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        if request.method == 'GET':
+            return jsonify({'models': model_registry.status()}), 200
+        
+        data = request.get_json(silent=True) or {}
+        path = data.get('path')
+        
+        if not path:
+            return jsonify({'message': 'Model artifact path is required'}), 400
+        
+        name = data.get('name') or model_name_for(path)
+        
+        try:
+            model_registry.register(name, path)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        except Exception as e:
+            return jsonify({'message': f'Failed to load model: {str(e)}'}), 400
+        
+        return jsonify({
+            'message': f'Model {name} registered as a shadow model',
+            'models': model_registry.status()
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/admin/models/<name>', methods=['DELETE'])
+def admin_remove_model(name):
+    """Stop shadow scoring with a registered model and unload it"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify admin session
+        admin_session = admin_sessions_collection.find_one({'token': token})
+        
+        if not admin_session or admin_session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        try:
+            model_registry.unregister(name)
+        except KeyError:
+            return jsonify({'message': 'Model not found'}), 404
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        return jsonify({'message': f'Model {name} removed'}), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/admin/models/<name>/promote', methods=['POST'])
+def admin_promote_model(name):
+    """Serve a registered model as the primary; the previous primary becomes a shadow"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify admin session
+        admin_session = admin_sessions_collection.find_one({'token': token})
+        
+        if not admin_session or admin_session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        try:
+            model_registry.promote(name)
+        except KeyError:
+            return jsonify({'message': 'Model not found'}), 404
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        return jsonify({
+            'message': f'Model {name} promoted to primary',
+            'models': model_registry.status()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/admin/models/comparison/reset', methods=['POST'])
+def admin_reset_model_comparison():
+    """Clear the shadow latency and agreement counters"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify admin session
+        admin_session = admin_sessions_collection.find_one({'token': token})
+        
+        if not admin_session or admin_session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        model_registry.reset_comparison()
+        
+        return jsonify({'message': 'Model comparison reset', 'models': model_registry.status()}), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+def extract_feature_fields(data):
+    """Pick the raw feature values out of a request payload or CSV row"""
+    return {feature: data.get(feature) for feature in FEATURE_COLUMNS}
+
+
+def insert_prediction_records(records):
+    """Bulk insert prediction records in unordered chunks, returning {record index: error} for failed writes"""
+    failures = {}
+    for start in range(0, len(records), BATCH_INSERT_CHUNK_SIZE):
+        chunk = records[start:start + BATCH_INSERT_CHUNK_SIZE]
+        try:
+            predictions_collection.insert_many(chunk, ordered=False)
+        except BulkWriteError as e:
+            # Unordered inserts keep going past a bad document, so only the reported ones failed
+            for write_error in e.details.get('writeErrors', []):
+                failures[start + write_error['index']] = write_error.get('errmsg', 'Failed to save prediction')
+        except Exception as e:
+            for offset in range(len(chunk)):
+                failures[start + offset] = str(e)
+    return failures
+
+
+def score_matrix(serving, input_matrix):
+    """Score a transformed matrix on threads, or in the worker processes when it is very large"""
+    if sharded_inference is not None and len(input_matrix) >= BATCH_PROCESS_MIN_ROWS:
+        try:
+            return sharded_inference.score(
+                input_matrix, serving.version, model_registry.primary_manager().pickle_path)
+        except Exception as e:
+            print(f"Process scoring failed, scoring in-process: {e}")
+    return inference_policy.run(serving.score, input_matrix)
+
+
+def score_batch_frame(df, session, serving, row_offset=0):
+    """Score a DataFrame of CSV rows with ``serving`` and persist the predictions
     
-    # Mappings for categorical variables
-    mappings = {
-        'rbc': {'normal': 0, 'abnormal': 1},
-        'pc': {'normal': 0, 'abnormal': 1},
-        'pcc': {'notpresent': 0, 'present': 1},
-        'ba': {'notpresent': 0, 'present': 1},
-        'htn': {'no': 0, 'yes': 1},
-        'dm': {'no': 0, 'yes': 1},
-        'cad': {'no': 0, 'yes': 1},
-        'appet': {'good': 0, 'poor': 1},
-        'pe': {'no': 0, 'yes': 1},
-        'ane': {'no': 0, 'yes': 1}
-    }
+    Returns per-row results, timings and the validation summary of the rows (invalid row count and errors per column).
+
+    Callers resolve the ServingModel once per upload, so every chunk of a file is scored by the same model version.
+    """
+    scoring_started = time.perf_counter()
+    rows = df.to_dict('records')
     
-    # Convert data to proper format
-    processed_data = []
-    for feature in feature_names:
-        value = data.get(feature, '')
-        
-        # Handle NaN values
-        if pd.isna(value):
-            value = ''
-        
-        # Handle categorical variables
-        if feature in mappings:
-            value = str(value).lower().strip()
-            processed_data.append(mappings[feature].get(value, 0))
-        else:
-            # Handle numerical variables
-            try:
-                processed_data.append(float(value) if value != '' else 0.0)
-            except:
-                processed_data.append(0.0)
+    # Check types, ranges and categories of every column at once; only valid rows are scored
+    validation = validate_frame(df, serving.pipeline.categories, columns=serving.pipeline.columns)
+    input_matrix = serving.transform(df)
+    valid_mask = validation.valid_mask & np.isfinite(input_matrix).all(axis=1)
+    
+    predictions = np.empty(len(df), dtype=object)
+    confidences = np.zeros(len(df))
+    scored_rows = 0
+    if valid_mask.any():
+        # Identical rows are scored once and their result fanned out
+        unique_matrix, inverse = unique_rows(input_matrix[valid_mask])
+        model_started = time.perf_counter()
+        unique_predictions, unique_confidences = score_matrix(serving, unique_matrix)
+        model_ms = (time.perf_counter() - model_started) * 1000
+        predictions[valid_mask] = unique_predictions[inverse]
+        confidences[valid_mask] = unique_confidences[inverse]
+        scored_rows = len(unique_matrix)
+        batch_dedup_stats.record_rows(int(valid_mask.sum()), scored_rows, model_ms)
+    
+    # Candidate models score a sample of the same rows in the background
+    model_registry.shadow('batch', df, serving)
+    
+    results = []
+    records = []
+    record_positions = []
+    created_at = datetime.utcnow()
+    
+    for index, data in enumerate(rows):
+        row_id = row_offset + index + 1
+        if not valid_mask[index]:
+            results.append({
+                'id': row_id,
+                'prediction': 'Error',
+                'confidence': 0,
+                'error': validation.row_error(index) or 'Row contains non-finite numeric values',
+                'invalid_fields': validation.invalid_fields(index)
+            })
+            continue
+        
+        result = format_prediction(predictions[index])
+        confidence = float(confidences[index])
+        
+        records.append({
+            'user_id': session['user_id'],
+            'email': session['email'],
+            'type': 'batch',
+            'result': result,
+            'confidence': confidence * 100,
+            'model_version': serving.version,
+            **extract_feature_fields(data),
+            'created_at': created_at
+        })
+        record_positions.append(len(results))
+        results.append({
+            'id': row_id,
+            'prediction': result,
+            'confidence': round(confidence * 100, 2)
+        })
+    
+    scoring_ms = (time.perf_counter() - scoring_started) * 1000
+    
+    persistence_started = time.perf_counter()
+    failures = insert_prediction_records(records)
+    persistence_ms = (time.perf_counter() - persistence_started) * 1000
     
-    return np.array(processed_data).reshape(1, -1)
+    for record_index, error in failures.items():
+        results[record_positions[record_index]].update({'prediction': 'Error', 'confidence': 0, 'error': error})
+    if failures:
+        first_index, first_error = min(failures.items())
+        print(f"Error saving {len(failures)} of {len(records)} batch rows "
+              f"(first: row {results[record_positions[first_index]]['id']}: {first_error})")
+    
+    return results, {
+        'scoring_ms': round(scoring_ms, 2),
+        'persistence_ms': round(persistence_ms, 2),
+        'scored_rows': scored_rows,
+        'failed_saves': len(failures)
+    }, validation.summary()
+
+
+batch_job_queue = BatchJobQueue(
+    score_batch_frame,
+    model_registry.current,
+    max_workers=BATCH_JOB_WORKERS,
+    max_pending=BATCH_JOB_MAX_PENDING,
+    retention_seconds=BATCH_JOB_RETENTION_SECONDS,
+    chunk_size=BATCH_STREAM_CHUNK_SIZE
+)
+
+
+# Optional micro-batching of concurrent /api/predict calls (disabled when the window is 0)
+PREDICT_COALESCE_WINDOW_MS = float(os.getenv('PREDICT_COALESCE_WINDOW_MS', '0'))
+PREDICT_COALESCE_MAX_BATCH = int(os.getenv('PREDICT_COALESCE_MAX_BATCH', '64'))
+
+if PREDICT_COALESCE_WINDOW_MS > 0:
+    prediction_coalescer = PredictionCoalescer(
+        lambda serving, input_matrix: serving.score_with_trees(input_matrix),
+        window_ms=PREDICT_COALESCE_WINDOW_MS,
+        max_batch_size=PREDICT_COALESCE_MAX_BATCH
+    )
+else:
+    prediction_coalescer = None
+
+# Single predictions stop once the forest vote is settled. An optional confidence bound
+# (e.g. 0.95) stops earlier still, after at least EARLY_EXIT_MIN_TREES trees.
+EARLY_EXIT_CONFIDENCE = float(os.getenv('EARLY_EXIT_CONFIDENCE', '0')) or None
+EARLY_EXIT_MIN_TREES = int(os.getenv('EARLY_EXIT_MIN_TREES', '20'))
 
 
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """Make a single CKD prediction"""
     try:
-        if model is None:
+        if model_registry.current() is None:
             return jsonify({'message': 'Model not loaded'}), 500
         
         token = request.headers.get('Authorization', '').replace('Bearer ', '')
@@ -1278,25 +1736,42 @@ def predict():
         
         data = request.get_json()
         
-        # Preprocess input
-        input_data = preprocess_input(data)
-        
-        # Apply transformations if available
-        if scaler is not None:
-            input_data = scaler.transform(input_data)
+        # Use one model version for the whole request, even if a reload happens meanwhile
+        serving = model_registry.current()
+        if serving is None:
+            return jsonify({'message': 'Model not loaded'}), 500
         
-        if feature_selector is not None:
-            input_data = feature_selector.transform(input_data)
+        # Encode, impute, scale and select features
+        input_data = serving.transform(data)
         
-        # Make prediction
-        prediction = model.predict(input_data)[0]
-        prediction_proba = model.predict_proba(input_data)[0]
+        # Make prediction (or reuse the result for an identical panel)
+        prediction_cache.ensure_version(serving.version)
+        cache_key = PredictionCache.make_key(input_data, serving.version)
+        cached = prediction_cache.get(cache_key)
+        cache_hit = cached is not None
         
-        # Get confidence (probability of predicted class)
-        confidence = float(max(prediction_proba))
+        if not cache_hit:
+            if prediction_coalescer is not None:
+                cached = prediction_coalescer.predict(input_data, serving)
+            else:
+                # Stops evaluating trees once the remaining ones can no longer change the result
+                cached = serving.score_one(input_data, confidence=EARLY_EXIT_CONFIDENCE,
+                                           min_trees=EARLY_EXIT_MIN_TREES)
+            prediction_cache.put(cache_key, cached)
+        
+        model_registry.shadow('single', data, serving)
+        
+        prediction, confidence, trees_used = cached
+        # The confidence is a cascade probability, the full forest's or the vote share of an early exit
+        if trees_used == 0:
+            confidence_source = 'cascade'
+        elif trees_used == serving.n_estimators:
+            confidence_source = 'forest'
+        else:
+            confidence_source = 'early_exit'
         
         # Convert prediction to readable format
-        result = 'CKD' if prediction == 0 else 'No CKD'
+        result = format_prediction(prediction)
         
         # Save prediction to database
         prediction_record = {
@@ -1306,30 +1781,10 @@ def predict():
             'patient_name': data.get('patientName', 'Anonymous'),
             'result': result,
             'confidence': confidence * 100,
-            'age': data.get('age'),
-            'bp': data.get('bp'),
-            'sg': data.get('sg'),
-            'al': data.get('al'),
-            'su': data.get('su'),
-            'bgr': data.get('bgr'),
-            'bu': data.get('bu'),
-            'sc': data.get('sc'),
-            'sod': data.get('sod'),
-            'pot': data.get('pot'),
-            'hemo': data.get('hemo'),
-            'pcv': data.get('pcv'),
-            'wc': data.get('wc'),
-            'rc': data.get('rc'),
-            'rbc': data.get('rbc'),
-            'pc': data.get('pc'),
-            'pcc': data.get('pcc'),
-            'ba': data.get('ba'),
-            'htn': data.get('htn'),
-            'dm': data.get('dm'),
-            'cad': data.get('cad'),
-            'appet': data.get('appet'),
-            'pe': data.get('pe'),
-            'ane': data.get('ane'),
+            'model_version': serving.version,
+            'trees_used': trees_used,
+            'confidence_source': confidence_source,
+            **extract_feature_fields(data),
             'created_at': datetime.utcnow()
         }
         
@@ -1338,6 +1793,9 @@ def predict():
         return jsonify({
             'prediction': result,
             'confidence': confidence,
+            'cached': cache_hit,
+            'trees_used': trees_used,
+            'confidence_source': confidence_source,
             'message': 'Prediction made successfully'
         }), 200
         
@@ -1347,9 +1805,9 @@ def predict():
 
 @app.route('/api/predict-batch', methods=['POST'])
 def predict_batch():
-    """Make batch CKD predictions from CSV file"""
+    """Make batch CKD predictions from a CSV, compressed CSV, Parquet or Arrow IPC file"""
     try:
-        if model is None:
+        if model_registry.current() is None:
             return jsonify({'message': 'Model not loaded'}), 500
         
         token = request.headers.get('Authorization', '').replace('Bearer ', '')
@@ -1372,116 +1830,291 @@ def predict_batch():
         if file.filename == '':
             return jsonify({'message': 'No file selected'}), 400
         
-        if not file.filename.endswith('.csv'):
-            return jsonify({'message': 'File must be a CSV'}), 400
-        
-        # Read CSV file
-        df = pd.read_csv(file)
-        
-        # Remove classification column if it exists
-        if 'classification' in df.columns:
-            df = df.drop('classification', axis=1)
-        
-        # Remove id column if it exists
-        if 'id' in df.columns:
-            df = df.drop('id', axis=1)
-        
-        print(f"CSV loaded with {len(df)} rows and columns: {df.columns.tolist()}")
+        try:
+            upload_extension(file.filename)
+        except UploadFormatError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # A repeat upload of the same file by the same user gets the stored results back
+        upload_hash = fingerprint_upload(file.stream)
+        serving = model_registry.current()
+        upload_cache.ensure_version(serving.version)
+        upload_key = (serving.version, session['user_id'], upload_hash)
+        cached = upload_cache.get(upload_key)
+        if cached is not None:
+            response, spent_ms = cached
+            batch_dedup_stats.record_upload(True, response['summary']['total'], spent_ms)
+            return jsonify({**response, 'cached': True, 'upload_hash': upload_hash}), 200
+        
+        # Read only the feature columns (CSV, compressed CSV, Parquet or Arrow IPC)
+        try:
+            df = read_upload(file.stream, file.filename)
+        except (ValueError, ImportError) as e:
+            # Also covers pandas and pyarrow parse errors, which subclass ValueError
+            return jsonify({'message': f'Could not read file: {str(e)}'}), 400
         
-        results = []
+        print(f"Upload loaded with {len(df)} rows and columns: {df.columns.tolist()}")
         
-        # Process each row
-        for index, row in df.iterrows():
-            try:
-                # Convert row to dict
-                data = row.to_dict()
-                
-                # Preprocess input
-                input_data = preprocess_input(data)
-                
-                # Apply transformations if available
-                if scaler is not None:
-                    input_data = scaler.transform(input_data)
-                
-                if feature_selector is not None:
-                    input_data = feature_selector.transform(input_data)
-                
-                # Make prediction
-                prediction = model.predict(input_data)[0]
-                prediction_proba = model.predict_proba(input_data)[0]
-                
-                # Get confidence
-                confidence = float(max(prediction_proba))
-                
-                # Convert prediction to readable format
-                result = 'CKD' if prediction == 1 else 'No CKD'
-                
-                # Save prediction to database
-                prediction_record = {
-                    'user_id': session['user_id'],
-                    'email': session['email'],
-                    'type': 'batch',
-                    'result': result,
-                    'confidence': confidence * 100,
-                    'age': data.get('age'),
-                    'bp': data.get('bp'),
-                    'sg': data.get('sg'),
-                    'al': data.get('al'),
-                    'su': data.get('su'),
-                    'bgr': data.get('bgr'),
-                    'bu': data.get('bu'),
-                    'sc': data.get('sc'),
-                    'sod': data.get('sod'),
-                    'pot': data.get('pot'),
-                    'hemo': data.get('hemo'),
-                    'pcv': data.get('pcv'),
-                    'wc': data.get('wc'),
-                    'rc': data.get('rc'),
-                    'rbc': data.get('rbc'),
-                    'pc': data.get('pc'),
-                    'pcc': data.get('pcc'),
-                    'ba': data.get('ba'),
-                    'htn': data.get('htn'),
-                    'dm': data.get('dm'),
-                    'cad': data.get('cad'),
-                    'appet': data.get('appet'),
-                    'pe': data.get('pe'),
-                    'ane': data.get('ane'),
-                    'created_at': datetime.utcnow()
-                }
-                
-                predictions_collection.insert_one(prediction_record)
-                
-                results.append({
-                    'id': index + 1,
-                    'prediction': result,
-                    'confidence': round(confidence * 100, 2)
-                })
-                
-            except Exception as e:
-                print(f"Error processing row {index + 1}: {str(e)}")  # Log the error
-                import traceback
-                traceback.print_exc()  # Print full traceback
-                results.append({
-                    'id': index + 1,
-                    'prediction': 'Error',
-                    'confidence': 0,
-                    'error': str(e)
-                })
+        results, timing, validation = score_batch_frame(df, session, serving)
         
         # Calculate summary
         total = len(results)
         ckd_count = sum(1 for r in results if r['prediction'] == 'CKD')
         not_ckd_count = sum(1 for r in results if r['prediction'] == 'No CKD')
+        error_count = sum(1 for r in results if r['prediction'] == 'Error')
         
-        return jsonify({
+        response = {
             'results': results,
             'summary': {
                 'total': total,
                 'ckd': ckd_count,
-                'notCkd': not_ckd_count
+                'notCkd': not_ckd_count,
+                'errors': error_count,
+                'model_version': serving.version
             },
+            'validation': validation,
+            'timing': timing,
             'message': 'Batch prediction completed successfully'
+        }
+        
+        # Rows that failed to save should be retried, so only fully saved uploads are reused
+        if not timing['failed_saves']:
+            upload_cache.put(upload_key, (response, timing['scoring_ms'] + timing['persistence_ms']), weight=total)
+        batch_dedup_stats.record_upload(False)
+        
+        return jsonify({**response, 'cached': False, 'upload_hash': upload_hash}), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/predict-batch/stream', methods=['POST'])
+def predict_batch_stream():
+    """Score an uploaded file chunk by chunk and stream the results back as NDJSON or CSV lines"""
+    try:
+        if model_registry.current() is None:
+            return jsonify({'message': 'Model not loaded'}), 500
+        
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify user session
+        session = sessions_collection.find_one({'token': token})
+        
+        if not session or session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        output_format = request.args.get('format', 'ndjson').lower()
+        if output_format not in ('ndjson', 'csv'):
+            return jsonify({'message': 'Format must be ndjson or csv'}), 400
+        
+        # Check if file is present
+        if 'file' not in request.files:
+            return jsonify({'message': 'No file provided'}), 400
+        
+        file = request.files['file']
+        
+        if file.filename == '':
+            return jsonify({'message': 'No file selected'}), 400
+        
+        try:
+            upload_extension(file.filename)
+        except UploadFormatError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # Every chunk is scored by this model version, even if a reload happens mid-upload
+        serving = model_registry.current()
+        if serving is None:
+            return jsonify({'message': 'Model not loaded'}), 500
+        
+        # The upload is closed once this view returns, so spool it to disk for the generator
+        upload = tempfile.TemporaryFile()
+        file.save(upload)
+        upload.seek(0)
+        filename = file.filename
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+    
+    result_fields = ['id', 'prediction', 'confidence', 'error']
+    
+    def format_lines(results, summary=None, header=False):
+        if output_format == 'ndjson':
+            lines = [json.dumps(result) + '\n' for result in results]
+            if summary is not None:
+                lines.append(json.dumps({'summary': summary}) + '\n')
+            return ''.join(lines)
+        
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=result_fields, extrasaction='ignore', lineterminator='\n')
+        if header:
+            writer.writeheader()
+        writer.writerows(results)
+        if summary is not None:
+            # Flatten the validation summary so the line stays comma-separated key=value pairs
+            fields = {key: value for key, value in summary.items() if key != 'validation'}
+            fields['invalid_rows'] = summary['validation']['invalid_rows']
+            fields['invalid_fields'] = ';'.join(
+                f'{column}:{sum(errors.values())}' for column, errors in summary['validation']['columns'].items())
+            buffer.write('# summary ' + ','.join(f'{key}={value}' for key, value in fields.items()) + '\n')
+        return buffer.getvalue()
+    
+    def generate():
+        summary = new_batch_summary(serving.version)
+        if output_format == 'csv':
+            yield format_lines([], header=True)
+        
+        try:
+            # Only one chunk of the upload is held in memory at a time
+            for chunk in iter_upload_chunks(upload, filename, chunksize=BATCH_STREAM_CHUNK_SIZE):
+                results, timing, validation = score_batch_frame(chunk, session, serving, row_offset=summary['total'])
+                accumulate_batch_summary(summary, results, timing, validation)
+                
+                yield format_lines(results)
+        except Exception as e:
+            summary['error'] = str(e)
+        finally:
+            upload.close()
+        
+        yield format_lines([], summary)
+    
+    mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'text/csv'
+    return Response(generate(), mimetype=mimetype)
+
+
+@app.route('/api/predict-batch/jobs', methods=['POST'])
+def submit_batch_job():
+    """Queue an uploaded file for background batch prediction and return its job id"""
+    try:
+        if model_registry.current() is None:
+            return jsonify({'message': 'Model not loaded'}), 500
+        
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify user session
+        session = sessions_collection.find_one({'token': token})
+        
+        if not session or session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        # Check if file is present
+        if 'file' not in request.files:
+            return jsonify({'message': 'No file provided'}), 400
+        
+        file = request.files['file']
+        
+        if file.filename == '':
+            return jsonify({'message': 'No file selected'}), 400
+        
+        try:
+            upload_extension(file.filename)
+        except UploadFormatError as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # The worker reads the upload after this request has finished
+        fd, upload_path = tempfile.mkstemp(suffix=upload_extension(file.filename), prefix='ckd-batch-')
+        with os.fdopen(fd, 'wb') as upload:
+            file.save(upload)
+        
+        context = {'user_id': session['user_id'], 'email': session['email']}
+        try:
+            job_id = batch_job_queue.submit(session['user_id'], upload_path, context)
+        except JobQueueFull as e:
+            os.remove(upload_path)
+            return jsonify({'message': f'Batch queue is full, try again later ({str(e)})'}), 503
+        
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'message': 'Batch job submitted successfully'
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/predict-batch/jobs/<job_id>', methods=['GET'])
+def get_batch_job(job_id):
+    """Get the status and progress of a background batch job"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify user session
+        session = sessions_collection.find_one({'token': token})
+        
+        if not session or session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        job = batch_job_queue.get(job_id)
+        
+        if not job or job['owner_id'] != session['user_id']:
+            return jsonify({'message': 'Job not found'}), 404
+        
+        total_rows = job['total_rows']
+        progress = round(100 * job['processed_rows'] / total_rows, 2) if total_rows else None
+        if job['status'] == 'completed':
+            progress = 100.0
+        
+        return jsonify({
+            'job_id': job['id'],
+            'status': job['status'],
+            'total_rows': total_rows,
+            'processed_rows': job['processed_rows'],
+            'progress': progress,
+            'summary': job['summary'],
+            'error': job['error'],
+            'created_at': job['created_at'].isoformat(),
+            'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None,
+            'expires_at': job['expires_at'].isoformat() if job['expires_at'] else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': f'Server error: {str(e)}'}), 500
+
+
+@app.route('/api/predict-batch/jobs/<job_id>/results', methods=['GET'])
+def get_batch_job_results(job_id):
+    """Page through the per-row results of a background batch job"""
+    try:
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'No token provided'}), 401
+        
+        # Verify user session
+        session = sessions_collection.find_one({'token': token})
+        
+        if not session or session['expires_at'] < datetime.utcnow():
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        
+        job = batch_job_queue.get(job_id)
+        
+        if not job or job['owner_id'] != session['user_id']:
+            return jsonify({'message': 'Job not found'}), 404
+        
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 100, type=int), 1), 1000)
+        
+        page_results = batch_job_queue.get_results(job_id, page, per_page)
+        if page_results is None:
+            return jsonify({'message': 'Job not found'}), 404
+        results, available = page_results
+        
+        return jsonify({
+            'job_id': job_id,
+            'status': job['status'],
+            'results': results,
+            'page': page,
+            'per_page': per_page,
+            'available': available
         }), 200
         
     except Exception as e:
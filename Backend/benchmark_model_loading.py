@@ -0,0 +1,145 @@
+"""
+Compare worker startup cost of the pickled model artifact against the
+memory-mapped artifact (src/model_artifact.py).
+
+Starts N worker processes per format that load the model the same way app.py
+does and score one row. It then reports load time and how much memory the
+workers use together. On Linux memory comes from /proc/self/smaps_rollup: PSS
+splits shared pages between the processes that map them, so the PSS sum
+across workers is the physical memory the format really costs.
+
+Usage:
+    python benchmark_model_loading.py [--workers 4] [--n-estimators 0]
+
+With --n-estimators > 0 a throwaway forest of that size is trained on
+data/kidney_disease.csv to show how the difference grows with model size.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, 'src')
+
+
+def read_memory_kb():
+    """Rss/Pss/private memory of the current process in kB (Linux only)."""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+
+def worker(artifact_format, pickle_path, barrier, results):
+    import numpy as np
+    from compiled_forest import CompiledForest
+    from model_artifact import load_artifact, mmap_path_for, read_pickled_model
+
+    before = read_memory_kb()
+    started = time.perf_counter()
+    if artifact_format == 'pickle':
+        model, pipeline = read_pickled_model(pickle_path)
+        forest = CompiledForest.from_sklearn(model)
+    else:
+        forest, pipeline, _ = load_artifact(mmap_path_for(pickle_path))
+    load_seconds = time.perf_counter() - started
+
+    # Score enough rows to touch every tree
+    started = time.perf_counter()
+    forest.predict_with_proba(np.zeros((64, len(pipeline.fused_arrays()[0]))))
+    first_prediction_seconds = time.perf_counter() - started
+
+    # Measure while every worker still has the model loaded
+    barrier.wait()
+    after = read_memory_kb()
+    barrier.wait()
+
+    delta = {key: after[key] - before[key] for key in after} if before and after else None
+    results.put({'load_ms': load_seconds * 1000, 'first_prediction_ms': first_prediction_seconds * 1000,
+                 'memory_kb': delta})
+
+
+def run_workers(artifact_format, pickle_path, workers):
+    ctx = mp.get_context('spawn')
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(artifact_format, pickle_path, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return collected
+
+
+def build_synthetic_artifact(n_estimators, directory):
+    """Train a throwaway forest of the given size and save it like train_model.py does."""
+    from sklearn.ensemble import RandomForestClassifier
+    from dataset_cache import load_fitted_pipeline
+
+    X, y, pipeline = load_fitted_pipeline('data/kidney_disease.csv', k=15)
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=42, n_jobs=-1).fit(X, y)
+    pickle_path = os.path.join(directory, 'random_forest_ckd.pkl')
+    with open(pickle_path, 'wb') as f:
+        pickle.dump({'model': model, 'scaler': pipeline.scaler, 'selector': pipeline.selector,
+                     'pipeline': pipeline}, f)
+    return pickle_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--n-estimators', type=int, default=0)
+    args = parser.parse_args()
+
+    from model_artifact import export_artifact, mmap_path_for
+
+    workdir = tempfile.mkdtemp(prefix='ckd-artifact-bench-')
+    try:
+        if args.n_estimators > 0:
+            pickle_path = build_synthetic_artifact(args.n_estimators, workdir)
+        else:
+            pickle_path = os.path.join(workdir, 'random_forest_ckd.pkl')
+            shutil.copy('models/random_forest_ckd.pkl', pickle_path)
+        header = export_artifact(pickle_path, mmap_path_for(pickle_path))
+
+        print('=' * 80)
+        print(f"MODEL ARTIFACT LOADING: {header['n_estimators']} trees, "
+              f"{os.path.getsize(pickle_path) / 1024:.0f} kB pickle, {args.workers} workers")
+        print('=' * 80)
+
+        for artifact_format in ('pickle', 'mmap'):
+            runs = run_workers(artifact_format, pickle_path, args.workers)
+            load_ms = sorted(run['load_ms'] for run in runs)
+            first_ms = sorted(run['first_prediction_ms'] for run in runs)
+            print(f"\n{artifact_format}:")
+            print(f"  load time          median {load_ms[len(load_ms) // 2]:8.2f} ms   max {load_ms[-1]:8.2f} ms")
+            print(f"  first prediction   median {first_ms[len(first_ms) // 2]:8.2f} ms   max {first_ms[-1]:8.2f} ms")
+            if all(run['memory_kb'] for run in runs):
+                pss = sum(run['memory_kb']['pss'] for run in runs)
+                private = sum(run['memory_kb']['private'] for run in runs)
+                rss = sum(run['memory_kb']['rss'] for run in runs)
+                print(f"  memory added (all workers)  RSS {rss:8d} kB   PSS {pss:8d} kB   private {private:8d} kB")
+            else:
+                print("  memory: /proc/self/smaps_rollup not available on this platform")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
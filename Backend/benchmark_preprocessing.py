@@ -0,0 +1,128 @@
+"""
+Compare the typed preprocessing loader (src/preprocess_data.py) with the
+previous untyped path at several dataset sizes.
+
+Synthetic datasets are built by sampling rows of data/kidney_disease.csv with
+replacement (raw text, including its stray tabs and "?" tokens). Each loader
+runs in a fresh process so its peak RSS is measured on its own, and the two
+outputs are checked to be identical (the untyped result rounded to float32).
+
+Usage:
+    python benchmark_preprocessing.py [--rows 400 100000 1000000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, 'src')
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def untyped_preprocess(csv_path):
+    """The previous load_and_preprocess_data: object columns, per-column cleaning and encoding."""
+    from sklearn.preprocessing import LabelEncoder
+    from feature_pipeline import FeaturePipeline
+
+    df = pd.read_csv(csv_path)
+    if 'id' in df.columns:
+        df = df.drop('id', axis=1)
+    y = LabelEncoder().fit_transform(df['classification'].astype(str).str.strip())
+    features = df.drop('classification', axis=1)
+    pipeline = FeaturePipeline().fit(features)
+    return pipeline.scale(pipeline.encode(features)), y, pipeline.scaler
+
+
+def typed_preprocess(csv_path):
+    from preprocess_data import load_and_preprocess_data
+    return load_and_preprocess_data(csv_path)
+
+
+LOADERS = {'untyped': untyped_preprocess, 'typed': typed_preprocess}
+
+
+def measure(loader, csv_path, output_path):
+    """Runs in a child process: load once, save the matrix and print JSON as the last line."""
+    # Import outside the timed region
+    import feature_pipeline, preprocess_data  # noqa: F401
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    X, _, _ = LOADERS[loader](csv_path)
+    seconds = time.perf_counter() - started
+    peak = peak_rss_mb()
+    np.save(output_path, X)
+    print(json.dumps({
+        'seconds': seconds,
+        'peak_mb': None if peak is None else peak - baseline,
+        'dtype': str(X.dtype),
+        'matrix_mb': X.nbytes / 1024 ** 2,
+    }))
+
+
+def write_dataset(rows, path):
+    raw = pd.read_csv('data/kidney_disease.csv', dtype=str, keep_default_na=False)
+    sample = raw.iloc[np.random.default_rng(42).integers(0, len(raw), rows)]
+    sample.assign(id=np.arange(rows)).to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[400, 100000, 1000000])
+    parser.add_argument('--measure', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    print('=' * 80)
+    print('PREPROCESSING: untyped per-column path vs typed vectorized loader')
+    print('=' * 80)
+    print(f"{'rows':>9}  {'loader':>8}  {'seconds':>8}  {'peak MB':>8}  {'matrix':>16}  {'speedup':>7}")
+
+    with tempfile.TemporaryDirectory(prefix='ckd-preprocess-') as directory:
+        for rows in args.rows:
+            # 400 rows is the real dataset itself
+            csv_path = 'data/kidney_disease.csv'
+            if rows != 400:
+                csv_path = os.path.join(directory, f'{rows}.csv')
+                write_dataset(rows, csv_path)
+
+            results = {}
+            for loader in LOADERS:
+                output_path = os.path.join(directory, f'{rows}-{loader}.npy')
+                output = subprocess.run(
+                    [sys.executable, __file__, '--measure', loader, csv_path, output_path],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                results[loader] = json.loads(output.strip().splitlines()[-1])
+
+                result = results[loader]
+                speedup = results['untyped']['seconds'] / result['seconds']
+                peak = 'n/a' if result['peak_mb'] is None else f"{result['peak_mb']:8.1f}"
+                matrix = f"{result['dtype']} {result['matrix_mb']:.1f} MB"
+                print(f"{rows:>9}  {loader:>8}  {result['seconds']:8.3f}  {peak:>8}  {matrix:>16}  {speedup:6.1f}x")
+
+            untyped = np.load(os.path.join(directory, f'{rows}-untyped.npy'))
+            typed = np.load(os.path.join(directory, f'{rows}-typed.npy'))
+            assert np.array_equal(untyped.astype(typed.dtype), typed), f"loaders disagree at {rows} rows"
+
+
+if __name__ == '__main__':
+    main()
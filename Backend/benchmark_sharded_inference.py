@@ -0,0 +1,72 @@
+"""
+Measure how batch scoring scales with worker processes (src/sharded_inference.py).
+
+Tiles the transformed rows of data/kidney_disease.csv up to --rows rows and
+scores them once in-process and then with the process pool at 1..N workers,
+checking that every run returns the same labels.
+
+Usage:
+    python benchmark_sharded_inference.py [--rows 200000] [--max-processes 4] [--repeats 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, 'src')
+
+from model_manager import ModelManager
+from preprocess_data import load_raw_data
+from sharded_inference import ShardedInferencePool
+
+MODEL_PATH = 'models/random_forest_ckd.pkl'
+
+
+def best_time(fn, repeats):
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--max-processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    manager = ModelManager(MODEL_PATH, poll_seconds=0)
+    manager.reload()
+    serving = manager.current()
+
+    features, _ = load_raw_data('data/kidney_disease.csv')
+    base = serving.transform(features)
+    X = np.resize(base, (args.rows, base.shape[1]))
+
+    print('=' * 80)
+    print(f"SHARDED BATCH INFERENCE: {args.rows} rows, {os.cpu_count()} CPUs, model {serving.version}")
+    print('=' * 80)
+
+    serial_seconds, (expected, _) = best_time(lambda: serving.score(X), args.repeats)
+    print(f"{'in-process':>14}  {serial_seconds * 1000:10.1f} ms   {args.rows / serial_seconds:12,.0f} rows/s")
+
+    for processes in range(1, args.max_processes + 1):
+        pool = ShardedInferencePool(MODEL_PATH, processes).start()
+        try:
+            pool.score(X[:1000], serving.version)
+            seconds, (labels, _) = best_time(lambda: pool.score(X, serving.version), args.repeats)
+        finally:
+            pool.close()
+        assert np.array_equal(labels, expected), "process pool labels differ from in-process scoring"
+        print(f"{processes:>4} processes  {seconds * 1000:10.1f} ms   {args.rows / seconds:12,.0f} rows/s   "
+              f"{serial_seconds / seconds:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Check that a single /api/predict scoring call costs less than scoring the
+full forest.
+
+Every row of data/kidney_disease.csv is scored one at a time, as the API
+serves it (ServingModel.score_one: cascade first stage, then the early-exit
+forest walk), and through the vectorized full forest (score_forest). Rows the
+cascade passes on to the forest are also timed on their own. Labels of the
+served path must match the full forest's unless the cascade answered.
+
+Usage:
+    python benchmark_single_prediction.py [--repeats 3] [--noise-rows 1000]
+
+--noise-rows adds random panels, which the cascade passes on to the forest
+more often than real ones.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, 'src')
+
+from model_manager import ModelManager
+from preprocess_data import load_raw_data
+
+MODEL_PATH = 'models/random_forest_ckd.pkl'
+
+
+def per_row_ms(fn, rows, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for row in rows:
+            fn(row)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000 / len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--noise-rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    manager = ModelManager(MODEL_PATH, poll_seconds=0)
+    manager.reload()
+    serving = manager.current()
+
+    features, _ = load_raw_data('data/kidney_disease.csv')
+    X = serving.transform(features)
+    rng = np.random.default_rng(42)
+    X = np.vstack([X, rng.normal(scale=2.0, size=(args.noise_rows, X.shape[1]))])
+    rows = [row[None] for row in X]
+
+    served = [serving.score_one(row) for row in rows]
+    trees_used = np.array([output[2] for output in served])
+    full_labels, _ = serving.score_forest(X)
+    forest_rows = trees_used > 0
+    assert np.array_equal(np.array([output[0] for output in served])[forest_rows], full_labels[forest_rows]), \
+        "early exit changed a forest decision"
+
+    print('=' * 80)
+    print(f"SINGLE-ROW SCORING: {len(rows)} rows, model {serving.version} "
+          f"({serving.n_estimators} trees, {'mmap' if serving.source.endswith('.mmap') else 'pickle'})")
+    print('=' * 80)
+
+    served_ms = per_row_ms(serving.score_one, rows, args.repeats)
+    full_ms = per_row_ms(serving.score_forest, rows, args.repeats)
+    print(f"{'served (score_one)':>28}  {served_ms:8.4f} ms/row   "
+          f"cascade answered {int((~forest_rows).sum())}, forest mean {trees_used[forest_rows].mean():.1f} trees")
+    print(f"{'full forest (score_forest)':>28}  {full_ms:8.4f} ms/row")
+
+    if forest_rows.any():
+        passed_on = [row for row, used in zip(rows, trees_used) if used]
+        early_ms = per_row_ms(serving.compiled_model.predict_row_early_exit, passed_on, args.repeats)
+        passed_full_ms = per_row_ms(serving.score_forest, passed_on, args.repeats)
+        print(f"{'forest rows, early exit':>28}  {early_ms:8.4f} ms/row")
+        print(f"{'forest rows, full forest':>28}  {passed_full_ms:8.4f} ms/row")
+
+    assert served_ms < full_ms, f"served path ({served_ms:.4f} ms) is not faster than the full forest ({full_ms:.4f} ms)"
+    print(f"Served path is {full_ms / served_ms:.1f}x faster than the full forest")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare batch upload formats (src/upload_formats.py): parse time and peak memory.
+
+Tiles data/kidney_disease.csv up to --rows rows and writes it as CSV, gzip CSV,
+Parquet and Arrow IPC. Each format is then read in a fresh process, so peak
+RSS is not skewed by earlier runs, and the time to parse the feature columns
+and to build the model input matrix is reported separately.
+
+The raw dataset keeps some numeric columns as text (e.g. "\t?"); --typed
+writes them as float columns, as a lab system exporting Parquet would.
+
+Usage:
+    python benchmark_upload_formats.py [--rows 1000000] [--repeats 3] [--typed]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, 'src')
+
+FORMATS = ['k.csv', 'k.csv.gz', 'k.parquet', 'k.arrow']
+MODEL_PATH = 'models/random_forest_ckd.pkl'
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def write_files(rows, directory, typed=False):
+    import pyarrow.feather as feather
+    from input_validation import VALID_RANGES
+
+    raw = pd.read_csv('data/kidney_disease.csv')
+    if typed:
+        for column in VALID_RANGES:
+            raw[column] = pd.to_numeric(raw[column], errors='coerce')
+    frame = raw.iloc[[index % len(raw) for index in range(rows)]].reset_index(drop=True)
+    paths = {name: os.path.join(directory, name) for name in FORMATS}
+    frame.to_csv(paths['k.csv'], index=False)
+    frame.to_csv(paths['k.csv.gz'], index=False, compression='gzip')
+    frame.to_parquet(paths['k.parquet'], index=False)
+    feather.write_feather(frame, paths['k.arrow'])
+    return paths
+
+
+def measure(path, repeats):
+    """Runs in a child process: parse one file ``repeats`` times and print JSON as the last line."""
+    from model_manager import ModelManager
+    from upload_formats import read_upload
+
+    manager = ModelManager(MODEL_PATH, poll_seconds=0)
+    manager.reload()
+    serving = manager.current()
+
+    baseline = peak_rss_mb()
+    parse_seconds = transform_seconds = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        frame = read_upload(path, path)
+        parsed = time.perf_counter()
+        serving.transform(frame)
+        parse_seconds = min(parse_seconds, parsed - started)
+        transform_seconds = min(transform_seconds, time.perf_counter() - parsed)
+        del frame
+    peak = peak_rss_mb()
+
+    print(json.dumps({
+        'parse_ms': parse_seconds * 1000,
+        'transform_ms': transform_seconds * 1000,
+        'peak_mb': None if peak is None else peak - baseline,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--typed', action='store_true')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.repeats)
+        return
+
+    print('=' * 80)
+    print(f"UPLOAD FORMATS: {args.rows} rows, {'typed' if args.typed else 'raw'} numeric columns")
+    print('=' * 80)
+    print(f"{'format':>12}  {'file MB':>8}  {'parse ms':>10}  {'matrix ms':>10}  {'peak MB':>8}")
+
+    with tempfile.TemporaryDirectory(prefix='ckd-formats-') as directory:
+        paths = write_files(args.rows, directory, args.typed)
+        for name in FORMATS:
+            output = subprocess.run(
+                [sys.executable, __file__, '--measure', paths[name], '--repeats', str(args.repeats)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            peak = 'n/a' if result['peak_mb'] is None else f"{result['peak_mb']:8.1f}"
+            print(f"{name[1:]:>12}  {os.path.getsize(paths[name]) / 1024 ** 2:8.1f}  "
+                  f"{result['parse_ms']:10.1f}  {result['transform_ms']:10.1f}  {peak:>8}")
+
+
+if __name__ == '__main__':
+    main()
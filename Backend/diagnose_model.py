@@ -8,8 +8,7 @@ from sklearn.model_selection import train_test_split
 import sys
 sys.path.insert(0, 'src')
 
-from preprocess_data import load_and_preprocess_data
-from feature_selection import apply_feature_selection
+from dataset_cache import load_preprocessed
 
 print("="*80)
 print("DIAGNOSING MODEL TRAINING ISSUE")
@@ -28,14 +27,13 @@ print(f"Ratio - No CKD: {(df['classification']=='notckd').sum()}/{len(df)} "
 
 # Load and check processed data
 print("\n2. PREPROCESSING CHECK:")
-X, y, scaler = load_and_preprocess_data('data/kidney_disease.csv')
+X, y, scaler, X_selected, selector = load_preprocessed('data/kidney_disease.csv', k=15)
 print(f"Preprocessed data shape: {X.shape}")
 print(f"Feature scaling - Mean: {X.mean(axis=0)[:5]}")
 print(f"Feature scaling - Std: {X.std(axis=0)[:5]}")
 
 # Check feature selection
 print("\n3. FEATURE SELECTION CHECK:")
-X_selected, selector = apply_feature_selection(X, y, k=15)
 print(f"Selected features shape: {X_selected.shape}")
 print(f"Number of features: {X_selected.shape[1]}")
 
@@ -0,0 +1,88 @@
+import hashlib
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+
+def fingerprint_upload(stream, block_size=1 << 20):
+    """SHA-256 of an uploaded file's bytes. The stream is rewound afterwards."""
+    start = stream.tell()
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(block_size), b''):
+        digest.update(block)
+    stream.seek(start)
+    return digest.hexdigest()
+
+
+def unique_rows(matrix):
+    """Distinct rows of a 2-D matrix, in first-seen order, and each row's index into them.
+
+    ``unique[inverse]`` reproduces ``matrix`` exactly. Rows are grouped by a
+    64-bit hash and the grouping is checked value by value, falling back to an
+    exact sort-based grouping on the (practically impossible) hash collision.
+    """
+    # Adding 0.0 folds -0.0 into 0.0, as in PredictionCache keys
+    matrix = np.ascontiguousarray(matrix, dtype=np.float64) + 0.0
+    if len(matrix) < 2:
+        return matrix, np.arange(len(matrix))
+
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(matrix, copy=False), index=False).to_numpy()
+    inverse, _ = pd.factorize(hashes)
+    _, first = np.unique(inverse, return_index=True)
+    unique = matrix[first]
+    if np.array_equal(unique[inverse], matrix, equal_nan=True):
+        return unique, inverse
+
+    rows = matrix.view(np.dtype((np.void, matrix.dtype.itemsize * matrix.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return matrix[first[order]], rank[inverse.ravel()]
+
+
+class BatchDedupStats:
+    """Counters for work skipped by upload fingerprinting and duplicate-row fan-out.
+
+    Saved time is estimated: a repeated upload saves what its first run spent
+    scoring and saving, and a duplicate row saves the mean scoring time of one
+    distinct row in its batch.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.uploads = 0
+        self.repeat_uploads = 0
+        self.repeat_upload_rows = 0
+        self.rows = 0
+        self.scored_rows = 0
+        self.saved_ms = 0.0
+
+    def record_upload(self, repeated, rows=0, saved_ms=0.0):
+        with self._lock:
+            self.uploads += 1
+            if repeated:
+                self.repeat_uploads += 1
+                self.repeat_upload_rows += rows
+                self.saved_ms += saved_ms
+
+    def record_rows(self, rows, scored_rows, scoring_ms):
+        with self._lock:
+            self.rows += rows
+            self.scored_rows += scored_rows
+            if scored_rows:
+                self.saved_ms += (rows - scored_rows) * scoring_ms / scored_rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                'uploads': self.uploads,
+                'repeat_uploads': self.repeat_uploads,
+                'repeat_upload_rows': self.repeat_upload_rows,
+                'rows': self.rows,
+                'scored_rows': self.scored_rows,
+                'duplicate_rows': self.rows - self.scored_rows,
+                'duplicate_rate': round(1 - self.scored_rows / self.rows, 4) if self.rows else 0.0,
+                'estimated_saved_ms': round(self.saved_ms, 2)
+            }
@@ -0,0 +1,153 @@
+import copy
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock
+
+from input_validation import merge_validation_summaries
+from upload_formats import count_upload_rows, iter_upload_chunks
+
+
+def new_batch_summary(model_version=None):
+    """Empty running summary for a chunked batch upload scored by ``model_version``."""
+    return {"total": 0, "ckd": 0, "notCkd": 0, "errors": 0, "scored_rows": 0,
+            "scoring_ms": 0.0, "persistence_ms": 0.0, "model_version": model_version,
+            "validation": {"invalid_rows": 0, "columns": {}}}
+
+
+def accumulate_batch_summary(summary, results, timing, validation=None):
+    """Fold one scored chunk's results, timings and validation summary into a running summary."""
+    summary["total"] += len(results)
+    summary["ckd"] += sum(1 for r in results if r["prediction"] == "CKD")
+    summary["notCkd"] += sum(1 for r in results if r["prediction"] == "No CKD")
+    summary["errors"] += sum(1 for r in results if r["prediction"] == "Error")
+    summary["scored_rows"] += timing["scored_rows"]
+    summary["scoring_ms"] = round(summary["scoring_ms"] + timing["scoring_ms"], 2)
+    summary["persistence_ms"] = round(summary["persistence_ms"] + timing["persistence_ms"], 2)
+    if validation is not None:
+        merge_validation_summaries(summary["validation"], validation)
+    return summary
+
+
+class JobQueueFull(Exception):
+    """Raised when too many batch jobs are already waiting or running."""
+
+
+class BatchJobQueue:
+    """In-process queue that scores uploaded files on a bounded worker pool.
+
+    ``score_chunk(df, context, model, row_offset)`` must return ``(results, timing, validation)``
+    for one chunk of rows, the same contract as ``score_batch_frame`` in app.py.
+    ``current_model()`` is called once when a job starts; every chunk of the job
+    is scored by that model, whose ``version`` the job summary records.
+    Finished jobs (and their results) are dropped after ``retention_seconds``.
+    """
+
+    def __init__(self, score_chunk, current_model, max_workers=2, max_pending=20,
+                 retention_seconds=3600, chunk_size=5000):
+        self.score_chunk = score_chunk
+        self.current_model = current_model
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-job")
+        self._jobs = {}
+        self._lock = Lock()
+
+    def submit(self, owner_id, upload_path, context):
+        """Queue an uploaded file (named with its format's extension) for scoring and return the new job id."""
+        self.cleanup_expired()
+
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job["status"] in ("queued", "running"))
+            if active >= self.max_pending:
+                raise JobQueueFull(f"{active} batch jobs are already in progress")
+
+            job_id = secrets.token_hex(12)
+            self._jobs[job_id] = {
+                "id": job_id,
+                "owner_id": owner_id,
+                "status": "queued",
+                "total_rows": None,
+                "processed_rows": 0,
+                "summary": new_batch_summary(),
+                "results": [],
+                "error": None,
+                "created_at": datetime.utcnow(),
+                "started_at": None,
+                "finished_at": None,
+                "expires_at": None,
+            }
+
+        self._executor.submit(self._run, job_id, upload_path, context)
+        return job_id
+
+    def get(self, job_id):
+        """Return a snapshot of a job's status (without its results), or None."""
+        self.cleanup_expired()
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {key: value for key, value in job.items() if key != "results"}
+            snapshot["summary"] = copy.deepcopy(job["summary"])
+            return snapshot
+
+    def get_results(self, job_id, page=1, per_page=100):
+        """Return one page of a job's per-row results, or None for unknown jobs."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            start = (page - 1) * per_page
+            return job["results"][start:start + per_page], len(job["results"])
+
+    def cleanup_expired(self):
+        """Drop finished jobs whose retention window has passed."""
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["expires_at"] is not None and job["expires_at"] < now]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id, upload_path, context):
+        self._update(job_id, status="running", started_at=datetime.utcnow())
+        status, error = "completed", None
+
+        try:
+            model = self.current_model()
+            if model is None:
+                raise RuntimeError("Model not loaded")
+            with self._lock:
+                self._jobs[job_id]["summary"]["model_version"] = model.version
+            self._update(job_id, total_rows=count_upload_rows(upload_path))
+            row_offset = 0
+            for chunk in iter_upload_chunks(upload_path, upload_path, chunksize=self.chunk_size):
+                results, timing, validation = self.score_chunk(chunk, context, model, row_offset)
+                row_offset += len(results)
+
+                with self._lock:
+                    job = self._jobs[job_id]
+                    accumulate_batch_summary(job["summary"], results, timing, validation)
+                    job["results"].extend(results)
+                    job["processed_rows"] = row_offset
+        except Exception as e:
+            status, error = "failed", str(e)
+        finally:
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
+
+        finished_at = datetime.utcnow()
+        self._update(job_id, status=status, error=error, finished_at=finished_at,
+                     expires_at=finished_at + timedelta(seconds=self.retention_seconds))
+
@@ -0,0 +1,100 @@
+import numpy as np
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+
+
+class LinearStage:
+    """Logistic-regression first stage of the serving cascade.
+
+    Scores the selected, scaled features with one dot product. Rows whose
+    confidence reaches ``threshold`` are answered here; the rest fall back to
+    the forest. Only binary models are supported.
+    """
+
+    def __init__(self, coef, intercept, classes, threshold):
+        self.coef = np.asarray(coef, dtype=np.float64).ravel()
+        self.intercept = float(np.asarray(intercept, dtype=np.float64).ravel()[0])
+        self.classes_ = np.asarray(classes)
+        self.threshold = float(threshold)
+
+    @classmethod
+    def from_sklearn(cls, model, threshold):
+        if len(model.classes_) != 2:
+            raise ValueError("The cascade first stage must be a binary classifier")
+        return cls(model.coef_, model.intercept_, model.classes_, threshold)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["coef"], data["intercept"], data["classes"], data["threshold"])
+
+    def to_dict(self):
+        return {
+            "type": "logistic",
+            "coef": self.coef.tolist(),
+            "intercept": self.intercept,
+            "classes": self.classes_.tolist(),
+            "threshold": self.threshold,
+        }
+
+    def predict_with_proba(self, X):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        positive = 1.0 / (1.0 + np.exp(-(X @ self.coef + self.intercept)))
+        proba = np.column_stack([1.0 - positive, positive])
+        return self.classes_[(positive > 0.5).astype(np.int64)], proba
+
+
+def cascade_predict(stage, X, fallback):
+    """Answer confident rows from ``stage`` and the rest with ``fallback(X_rows)``.
+
+    ``fallback`` returns ``(labels, confidences)``. Returns labels, confidences
+    and the mask of rows that needed the fallback model.
+    """
+    labels, proba = stage.predict_with_proba(X)
+    confidences = proba.max(axis=1)
+    needs_fallback = confidences < stage.threshold
+    if needs_fallback.any():
+        labels = labels.copy()
+        labels[needs_fallback], confidences[needs_fallback] = fallback(X[needs_fallback])
+    return labels, confidences, needs_fallback
+
+
+def calibrate_threshold(confidences, agrees, target_agreement):
+    """Lowest confidence threshold at which the accepted rows agree at ``target_agreement``.
+
+    Returns None when no threshold reaches the target.
+    """
+    order = np.argsort(-confidences, kind="stable")
+    agreement = np.cumsum(agrees[order]) / np.arange(1, len(order) + 1)
+    accepted = np.flatnonzero(agreement >= target_agreement)
+    if len(accepted) == 0:
+        return None
+    return float(confidences[order][accepted[-1]])
+
+
+def fit_cascade(X, y, forest, target_agreement=0.995, cv=5, random_state=42):
+    """Fit a linear first stage and calibrate its threshold against the forest.
+
+    Out-of-fold predictions of both models decide the threshold, so it
+    reflects how often the first stage agrees with the forest on rows neither
+    has seen. Returns ``(stage, report)``; ``stage`` is None if the first
+    stage never reaches the target agreement.
+    """
+    folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state)
+    fast_model = LogisticRegression(max_iter=1000, class_weight="balanced")
+
+    fast_proba = cross_val_predict(fast_model, X, y, cv=folds, method="predict_proba")
+    forest_labels = cross_val_predict(clone(forest), X, y, cv=folds)
+    fast_confidences = fast_proba.max(axis=1)
+    agrees = np.unique(y)[fast_proba.argmax(axis=1)] == forest_labels
+
+    threshold = calibrate_threshold(fast_confidences, agrees, target_agreement)
+    report = {
+        "target_agreement": target_agreement,
+        "threshold": threshold,
+        "calibration_rows": len(y),
+        "calibration_coverage": float((fast_confidences >= threshold).mean()) if threshold is not None else 0.0,
+    }
+    if threshold is None:
+        return None, report
+    return LinearStage.from_sklearn(fast_model.fit(X, y), threshold), report
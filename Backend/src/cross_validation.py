@@ -0,0 +1,203 @@
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_selection import SelectKBest, f_classif
+from sklearn.metrics import confusion_matrix
+from sklearn.model_selection import StratifiedKFold
+from sklearn.preprocessing import StandardScaler
+
+from compiled_forest import CompiledForest
+from dataset_cache import load_encoded
+from feature_pipeline import FEATURE_COLUMNS, FeaturePipeline
+from preprocess_data import imputation_values
+
+
+# Class labels 0 and 1
+CLASS_NAMES = ["CKD", "No CKD"]
+
+# Validation rows timed per fold, one at a time and as one batch (per-row cost is flat beyond these)
+LATENCY_SINGLE_ROWS = 1000
+LATENCY_BATCH_ROWS = 10000
+
+
+def measure_latency(compiled, X, repeats=3, single_rows=None, batch_rows=None):
+    """Best-of-``repeats`` serving latency of a compiled forest on the rows of ``X``.
+
+    Returns ``(single_ms, batch_us_per_row)``: the mean time of one
+    ``predict_row_early_exit`` call over the first ``single_rows`` rows and
+    the per-row time of scoring the first ``batch_rows`` rows as one batch
+    (all rows by default).
+    """
+    rows = X if single_rows is None else X[:single_rows]
+    batch = X if batch_rows is None else X[:batch_rows]
+    best_single = best_batch = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for row in rows:
+            compiled.predict_row_early_exit(row)
+        best_single = min(best_single, time.perf_counter() - started)
+        started = time.perf_counter()
+        compiled.predict_with_proba(batch)
+        best_batch = min(best_batch, time.perf_counter() - started)
+    return best_single * 1000 / len(rows), best_batch * 1e6 / len(batch)
+
+
+def fit_fold_pipeline(X_train, y_train, categories, k=15):
+    """Fit imputation, scaling and SelectKBest on one fold's encoded training rows.
+
+    Gives the FeaturePipeline that ``FeaturePipeline.fit`` learns from the
+    same raw rows, except that category codes come from the whole dataset
+    (they depend on no label, so this leaks nothing into the fold).
+    """
+    fill_values = imputation_values(X_train)
+    X_train = np.where(np.isnan(X_train), fill_values, X_train)
+    scaler = StandardScaler().fit(X_train)
+    X_scaled = np.nan_to_num(scaler.transform(X_train), nan=0.0, posinf=0.0, neginf=0.0)
+    selector = SelectKBest(score_func=f_classif, k=min(k, X_train.shape[1])).fit(X_scaled, y_train)
+    return FeaturePipeline(FEATURE_COLUMNS, categories, dict(zip(FEATURE_COLUMNS, fill_values.tolist())),
+                           scaler, selector)
+
+
+def transform_encoded(pipeline, X):
+    """Model input for encoded rows: the pipeline's imputation, then its fused scaling and selection."""
+    selected, offset, scale = pipeline.fused_arrays()
+    fill_values = np.array([pipeline.fill_values[pipeline.columns[index]] for index in selected])
+    X = X[:, selected]
+    return (np.where(np.isnan(X), fill_values, X) - offset) / scale
+
+
+def evaluate_fold(paths, fold, categories, base_params, forest_params, k=15, n_splits=5, random_state=42,
+                  latency_repeats=3):
+    """Fit and score one fold over the memory-mapped encoded matrix.
+
+    Only this fold's rows are read from the mapped file. The feature pipeline
+    is fitted on the fold's training rows alone, so nothing about the
+    validation rows reaches imputation, scaling or feature selection.
+    """
+    X = np.load(paths["X"], mmap_mode="r")
+    y = np.load(paths["y"])
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    train_rows, val_rows = next(itertools.islice(splitter.split(np.zeros(len(y)), y), fold, None))
+
+    started = time.perf_counter()
+    X_train = np.asarray(X[train_rows])
+    pipeline = fit_fold_pipeline(X_train, y[train_rows], categories, k=k)
+    model = RandomForestClassifier(**base_params, **forest_params, n_jobs=1)
+    model.fit(transform_encoded(pipeline, X_train).astype(np.float32), y[train_rows])
+    fit_seconds = time.perf_counter() - started
+    del X_train
+
+    X_val = transform_encoded(pipeline, np.asarray(X[val_rows]))
+    y_val = y[val_rows]
+    compiled = CompiledForest.from_sklearn(model)
+    labels = compiled.predict(X_val)
+    matrix = confusion_matrix(y_val, labels, labels=range(len(CLASS_NAMES)))
+    latency_ms, batch_us_per_row = measure_latency(
+        compiled, X_val, latency_repeats, LATENCY_SINGLE_ROWS, LATENCY_BATCH_ROWS)
+
+    return {
+        "fold": fold,
+        "train_rows": len(train_rows),
+        "val_rows": len(val_rows),
+        "accuracy": float(np.trace(matrix) / matrix.sum()),
+        "recall": (np.diag(matrix) / np.maximum(matrix.sum(axis=1), 1)).tolist(),
+        "confusion_matrix": matrix.tolist(),
+        "fit_seconds": fit_seconds,
+        "latency_ms": latency_ms,
+        "batch_us_per_row": batch_us_per_row,
+        "selected_columns": pipeline.selected_columns,
+    }
+
+
+def cross_validate(csv_path, base_params, forest_params, k=15, n_splits=5, workers=None, random_state=42,
+                   scratch_dir=None):
+    """Stratified k-fold evaluation of one forest configuration, folds in a process pool.
+
+    The dataset is encoded once (through the dataset cache) and written to a
+    scratch ``.npy`` file that every worker memory-maps, so the matrix is
+    neither pickled to the workers nor held once per process. With as many
+    workers as folds, the wall time is about that of one training run.
+    """
+    workers = max(1, min(n_splits, workers or os.cpu_count() or 1))
+    started = time.perf_counter()
+    X, y, categories = load_encoded(csv_path)
+    preprocessing_seconds = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory(prefix="ckd-cv-", dir=scratch_dir) as scratch:
+        paths = {"X": os.path.join(scratch, "X.npy"), "y": os.path.join(scratch, "y.npy")}
+        np.save(paths["X"], X)
+        np.save(paths["y"], y.to_numpy())
+        rows = len(y)
+        del X, y
+
+        args = (categories, base_params, forest_params, k, n_splits, random_state)
+        if workers == 1:
+            folds = [evaluate_fold(paths, fold, *args) for fold in range(n_splits)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(evaluate_fold, paths, fold, *args) for fold in range(n_splits)]
+                folds = [future.result() for future in futures]
+
+    matrices = np.array([fold["confusion_matrix"] for fold in folds])
+    recalls = np.array([fold["recall"] for fold in folds])
+    return {
+        "rows": rows,
+        "folds": n_splits,
+        "k": k,
+        "workers": workers,
+        "base_params": base_params,
+        "forest_params": forest_params,
+        "classes": CLASS_NAMES,
+        "accuracy": _spread([fold["accuracy"] for fold in folds]),
+        "recall": {name: _spread(recalls[:, label]) for label, name in enumerate(CLASS_NAMES)},
+        "confusion_matrix": matrices.sum(axis=0).tolist(),
+        "fit_seconds": _spread([fold["fit_seconds"] for fold in folds]),
+        "latency_ms": _spread([fold["latency_ms"] for fold in folds]),
+        "batch_us_per_row": _spread([fold["batch_us_per_row"] for fold in folds]),
+        "preprocessing_seconds": round(preprocessing_seconds, 3),
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "per_fold": folds,
+    }
+
+
+def format_report(report):
+    """Plain-text summary of a cross-validation report: spread across folds, then each fold."""
+    def spread(stats, fmt):
+        return (f"{stats['mean']:{fmt}} +- {stats['std']:{fmt}} "
+                f"(min {stats['min']:{fmt}}, max {stats['max']:{fmt}})")
+
+    lines = [
+        f"{report['folds']}-fold cross-validation on {report['rows']} rows, {report['workers']} workers: "
+        f"{report['total_seconds']:.1f}s (preprocessing {report['preprocessing_seconds']:.2f}s, "
+        f"mean fold fit {report['fit_seconds']['mean']:.2f}s)",
+        f"  accuracy        {spread(report['accuracy'], '.4f')}",
+    ]
+    for name in report["classes"]:
+        lines.append(f"  {name + ' recall':<15} {spread(report['recall'][name], '.4f')}")
+    lines += [
+        f"  single row ms   {spread(report['latency_ms'], '.4f')}",
+        f"  batch us/row    {spread(report['batch_us_per_row'], '.2f')}",
+        f"  confusion matrix (rows true {' / '.join(report['classes'])}, summed over folds): "
+        f"{report['confusion_matrix']}",
+        f"{'fold':>4}  {'rows':>7}  {'accuracy':>8}  {'recall':>15}  {'fit s':>6}  {'single ms':>9}  "
+        f"{'batch us':>8}  confusion",
+    ]
+    for fold in report["per_fold"]:
+        recall = " / ".join(f"{value:.3f}" for value in fold["recall"])
+        lines.append(
+            f"{fold['fold']:>4}  {fold['val_rows']:>7}  {fold['accuracy']:>8.4f}  {recall:>15}  "
+            f"{fold['fit_seconds']:>6.2f}  {fold['latency_ms']:>9.4f}  {fold['batch_us_per_row']:>8.2f}  "
+            f"{fold['confusion_matrix']}"
+        )
+    return "\n".join(lines)
+
+
+def _spread(values):
+    values = np.asarray(values, dtype=np.float64)
+    return {"mean": float(values.mean()), "std": float(values.std()),
+            "min": float(values.min()), "max": float(values.max())}
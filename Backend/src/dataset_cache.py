@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+import feature_pipeline
+import feature_selection
+import preprocess_data
+from feature_selection import apply_feature_selection
+from preprocess_data import load_and_fit_pipeline, load_and_preprocess_data, load_encoded_data
+
+
+# Preprocessed datasets live under this directory; set DATASET_CACHE_DIR="" to disable caching
+DEFAULT_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", "data/.cache")
+
+META_FILE = "meta.json"
+OBJECTS_FILE = "objects.pkl"
+
+# Entries are only valid for the code that produced them
+_CODE_MODULES = [preprocess_data, feature_pipeline, feature_selection]
+
+
+def file_digest(path):
+    """SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version():
+    """Hash of the preprocessing source files and library versions an entry depends on."""
+    digest = hashlib.sha256()
+    for path in [module.__file__ for module in _CODE_MODULES] + [__file__]:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    for library in (np, pd, sklearn):
+        digest.update(f"{library.__name__}={library.__version__};".encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_key(csv_path, kind, config):
+    """Content address of one preprocessed dataset: data hash, config and code version."""
+    payload = json.dumps({
+        "data": file_digest(csv_path),
+        "kind": kind,
+        "config": config,
+        "code": code_version(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+def cached(csv_path, kind, config, compute, cache_dir=None):
+    """Return ``compute()``'s ``(arrays, objects)`` for a CSV, from the cache when possible.
+
+    ``arrays`` is a dict of numpy arrays, stored as ``.npy`` files; ``objects``
+    is a dict of fitted transforms, stored in one pickle. Entries are written
+    to a temporary directory and renamed into place, so a reader never sees a
+    partial entry. Writing a new entry removes older entries with the same kind
+    and config for the same CSV path, which are stale once the data or code
+    changed.
+    """
+    cache_dir = DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return compute()
+
+    key = cache_key(csv_path, kind, config)
+    entry_dir = os.path.join(cache_dir, key)
+    if os.path.isdir(entry_dir):
+        try:
+            return _read_entry(entry_dir)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    arrays, objects = compute()
+
+    staging = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{key}-", dir=cache_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.asarray(array))
+        with open(os.path.join(staging, OBJECTS_FILE), "wb") as f:
+            pickle.dump(objects, f)
+        with open(os.path.join(staging, META_FILE), "w") as f:
+            json.dump({"source": os.path.abspath(csv_path), "kind": kind, "config": config,
+                       "arrays": list(arrays)}, f, indent=2)
+        os.rename(staging, entry_dir)
+    except OSError:
+        # Another process stored the same entry first, or the cache is not writable
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+    else:
+        _prune(cache_dir, csv_path, kind, config, key)
+
+    return arrays, objects
+
+
+def clear_cache(cache_dir=None):
+    """Delete every cached dataset."""
+    shutil.rmtree(DEFAULT_CACHE_DIR if cache_dir is None else cache_dir, ignore_errors=True)
+
+
+def load_preprocessed(csv_path, k=15, cache_dir=None):
+    """Cached ``load_and_preprocess_data`` followed by ``apply_feature_selection``.
+
+    Returns ``(X, y, scaler, X_selected, selector)``.
+    """
+    def compute():
+        X, y, scaler = load_and_preprocess_data(csv_path)
+        X_selected, selector = apply_feature_selection(X, y, k=k)
+        return {"X": X, "y": y.to_numpy(), "X_selected": X_selected}, {"scaler": scaler, "selector": selector}
+
+    arrays, objects = cached(csv_path, "preprocessed", {"k": k}, compute, cache_dir)
+    return arrays["X"], _labels(arrays["y"]), objects["scaler"], arrays["X_selected"], objects["selector"]
+
+
+def load_fitted_pipeline(csv_path, k=15, cache_dir=None):
+    """Cached ``load_and_fit_pipeline``: ``(X_selected, y, pipeline)``."""
+    def compute():
+        X_selected, y, pipeline = load_and_fit_pipeline(csv_path, k=k)
+        return {"X_selected": X_selected, "y": y.to_numpy()}, {"pipeline": pipeline}
+
+    arrays, objects = cached(csv_path, "pipeline", {"k": k}, compute, cache_dir)
+    return arrays["X_selected"], _labels(arrays["y"]), objects["pipeline"]
+
+
+def load_encoded(csv_path, cache_dir=None):
+    """Cached ``load_encoded_data``: ``(X, y, categories)`` with nothing fitted."""
+    def compute():
+        X, y, categories = load_encoded_data(csv_path)
+        return {"X": X, "y": y.to_numpy()}, {"categories": categories}
+
+    arrays, objects = cached(csv_path, "encoded", {}, compute, cache_dir)
+    return arrays["X"], _labels(arrays["y"]), objects["categories"]
+
+
+def _labels(values):
+    # Same Series load_raw_data returns
+    return pd.Series(values, name="classification")
+
+
+def _read_entry(entry_dir):
+    with open(os.path.join(entry_dir, META_FILE)) as f:
+        meta = json.load(f)
+    arrays = {name: np.load(os.path.join(entry_dir, f"{name}.npy")) for name in meta["arrays"]}
+    with open(os.path.join(entry_dir, OBJECTS_FILE), "rb") as f:
+        objects = pickle.load(f)
+    return arrays, objects
+
+
+def _prune(cache_dir, csv_path, kind, config, keep_key):
+    source = os.path.abspath(csv_path)
+    for name in os.listdir(cache_dir):
+        if name == keep_key or name.startswith("."):
+            continue
+        try:
+            with open(os.path.join(cache_dir, name, META_FILE)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get("source") == source and meta.get("kind") == kind and meta.get("config") == config:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import time
+
+    clear_cache()
+    for label in ("cold", "warm"):
+        started = time.perf_counter()
+        load_preprocessed("data/kidney_disease.csv")
+        load_fitted_pipeline("data/kidney_disease.csv")
+        print(f"{label}: {(time.perf_counter() - started) * 1000:.1f} ms")
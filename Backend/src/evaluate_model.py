@@ -1,9 +1,16 @@
+import argparse
+import json
 import pickle
+import time
+
 from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
-from sklearn.model_selection import train_test_split
 
-from preprocess_data import load_and_preprocess_data
-from feature_selection import apply_feature_selection
+from dataset_cache import load_preprocessed
+from preprocess_data import load_raw_data
+from compiled_forest import CompiledForest
+from cross_validation import cross_validate, format_report
+from model_manager import ServingModel
+from train_model import split_rows
 
 
 def evaluate_model():
@@ -12,12 +19,16 @@ def evaluate_model():
 
     model = saved["model"]
 
-    X, y, _ = load_and_preprocess_data("data/kidney_disease.csv")
-    X_selected, _ = apply_feature_selection(X, y, k=15)
+    if saved.get("pipeline") is not None:
+        # Score through the exact transform that was fitted at training time
+        features, y = load_raw_data("data/kidney_disease.csv")
+        X_selected = saved["pipeline"].transform(features)
+    else:
+        _, y, _, X_selected, _ = load_preprocessed("data/kidney_disease.csv", k=15)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_selected, y, test_size=0.2, random_state=42
-    )
+    # The rows train_model.py held out, so nothing below is measured on training rows
+    _, test_rows = split_rows(y)
+    X_test, y_test = X_selected[test_rows], y.iloc[test_rows]
 
     y_pred = model.predict(X_test)
 
@@ -25,6 +36,70 @@ def evaluate_model():
     print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
     print("Classification Report:\n", classification_report(y_test, y_pred, zero_division=0))
 
+    if saved.get("cascade") is not None:
+        evaluate_cascade(model, saved["cascade"], X_selected, y, X_test, y_test)
+
+
+def evaluate_cascade(model, cascade, X, y, X_test, y_test):
+    """Compare serving with the cascade against serving with the forest alone."""
+    compiled = CompiledForest.from_sklearn(model)
+    forest_only = ServingModel(model, compiled, None, None, None)
+    with_cascade = ServingModel(model, compiled, None, None, None, cascade=cascade)
+
+    print(f"\nCascade (first stage threshold {cascade.threshold:.4f}):")
+    for name, X_part, y_part in [("test split", X_test, y_test), ("full dataset", X, y)]:
+        forest_labels, _ = forest_only.score(X_part)
+        cascade_labels, _ = with_cascade.score(X_part)
+        fallback_rate = (cascade.predict_with_proba(X_part)[1].max(axis=1) < cascade.threshold).mean()
+        forest_accuracy = accuracy_score(y_part, forest_labels)
+        cascade_accuracy = accuracy_score(y_part, cascade_labels)
+        print(f"  {name}: fallback rate {fallback_rate:.1%}, accuracy {cascade_accuracy:.4f} vs forest "
+              f"{forest_accuracy:.4f} ({cascade_accuracy - forest_accuracy:+.4f}), "
+              f"{int((cascade_labels != forest_labels).sum())} decisions differ")
+
+    # Latency as served: single rows through score_one, and the whole file as one batch
+    rows = [X[i:i + 1] for i in range(len(X))]
+    for name, scorer in [("single row", lambda serving: [serving.score_one(row) for row in rows]),
+                         ("batch", lambda serving: serving.score(X))]:
+        timings = {}
+        for label, serving in [("forest", forest_only), ("cascade", with_cascade)]:
+            scorer(serving)
+            started = time.perf_counter()
+            for _ in range(5):
+                scorer(serving)
+            timings[label] = (time.perf_counter() - started) / 5 * 1000
+        per = len(rows) if name == "single row" else 1
+        print(f"  {name}: forest {timings['forest'] / per:.4f} ms, cascade {timings['cascade'] / per:.4f} ms "
+              f"({timings['forest'] / timings['cascade']:.1f}x faster)")
+
+
+def cross_validate_training_settings(csv_path, n_splits=5, workers=None, forest_params=None, report_path=None):
+    """k-fold cross-validation of the forest settings train_model.py trains with."""
+    from train_model import FOREST_BASE_PARAMS, FOREST_PARAMS
+
+    report = cross_validate(csv_path, FOREST_BASE_PARAMS, forest_params or FOREST_PARAMS, k=15,
+                            n_splits=n_splits, workers=workers)
+    print(format_report(report))
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {report_path}")
+
 
 if __name__ == "__main__":
-    evaluate_model()
+    parser = argparse.ArgumentParser(description="Evaluate the CKD random forest")
+    parser.add_argument("--cv", action="store_true",
+                        help="cross-validate the training settings in parallel instead of scoring the saved model")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None, help="fold processes (default: CPU count)")
+    parser.add_argument("--csv", default="data/kidney_disease.csv", help="dataset for --cv")
+    parser.add_argument("--params", type=json.loads, default=None,
+                        help='forest settings to evaluate instead of FOREST_PARAMS, e.g. \'{"max_depth": 6}\'')
+    parser.add_argument("--report", default=None, help="also write the --cv report as JSON")
+    args = parser.parse_args()
+
+    if args.cv:
+        cross_validate_training_settings(args.csv, n_splits=args.folds, workers=args.workers,
+                                         forest_params=args.params, report_path=args.report)
+    else:
+        evaluate_model()
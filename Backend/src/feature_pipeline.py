@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from feature_selection import apply_feature_selection
+
+
+# Raw feature columns, in the order they appear in data/kidney_disease.csv
+FEATURE_COLUMNS = ['age', 'bp', 'sg', 'al', 'su', 'rbc', 'pc', 'pcc', 'ba', 'bgr',
+                   'bu', 'sc', 'sod', 'pot', 'hemo', 'pcv', 'wc', 'rc', 'htn', 'dm',
+                   'cad', 'appet', 'pe', 'ane']
+
+CATEGORICAL_COLUMNS = ['rbc', 'pc', 'pcc', 'ba', 'htn', 'dm', 'cad', 'appet', 'pe', 'ane']
+
+# Raw values that mean "not measured" (after stripping whitespace)
+MISSING_TOKENS = ['', '?']
+
+# Diagnoses as app.py formats and clinicians confirm them, and their class labels
+CONFIRMED_LABELS = {'CKD': 0, 'No CKD': 1}
+
+# Column order and category codes app.py used before the pipeline was saved
+# with the model; only needed to serve artifacts that predate it
+LEGACY_SERVING_COLUMNS = ['age', 'bp', 'sg', 'al', 'su', 'bgr', 'bu', 'sc', 'sod', 'pot',
+                          'hemo', 'pcv', 'wc', 'rc', 'rbc', 'pc', 'pcc', 'ba', 'htn', 'dm',
+                          'cad', 'appet', 'pe', 'ane']
+
+LEGACY_CATEGORIES = {
+    'rbc': ['normal', 'abnormal'],
+    'pc': ['normal', 'abnormal'],
+    'pcc': ['notpresent', 'present'],
+    'ba': ['notpresent', 'present'],
+    'htn': ['no', 'yes'],
+    'dm': ['no', 'yes'],
+    'cad': ['no', 'yes'],
+    'appet': ['good', 'poor'],
+    'pe': ['no', 'yes'],
+    'ane': ['no', 'yes']
+}
+
+
+class FeaturePipeline:
+    """Fitted raw-input -> model-input transform shared by training and serving.
+
+    Holds the column order, categorical codes, imputation values, the fitted
+    StandardScaler and SelectKBest. ``transform`` only encodes the selected
+    columns and applies scaling and selection as one fused step, working
+    column-wise on any number of rows.
+    """
+
+    def __init__(self, columns=None, categories=None, fill_values=None, scaler=None, selector=None):
+        self.columns = list(columns or FEATURE_COLUMNS)
+        self.categories = dict(categories or {})
+        self.fill_values = dict(fill_values or {})
+        self.scaler = scaler
+        self.selector = selector
+        self._compile()
+
+    @classmethod
+    def from_arrays(cls, columns, categories, fill_values, selected, offset, scale):
+        """Rebuild a fitted pipeline from its fused arrays (no sklearn objects needed)."""
+        pipeline = cls(columns, categories, fill_values)
+        pipeline._selected = np.asarray(selected, dtype=np.int64)
+        pipeline._offset = np.asarray(offset, dtype=np.float64)
+        pipeline._scale = np.asarray(scale, dtype=np.float64)
+        return pipeline
+
+    def fused_arrays(self):
+        """Selected column indices and the fused scaling offset/scale for them."""
+        return self._selected, self._offset, self._scale
+
+    @classmethod
+    def from_legacy(cls, scaler=None, selector=None):
+        """Rebuild the transform app.py applied to models saved without a pipeline."""
+        fill_values = {column: 0.0 for column in LEGACY_SERVING_COLUMNS}
+        return cls(LEGACY_SERVING_COLUMNS, LEGACY_CATEGORIES, fill_values, scaler, selector)
+
+    def fit(self, features, y=None, k=None):
+        """Learn codes, imputation values and scaling from raw training rows.
+
+        With ``y`` and ``k`` the SelectKBest step is fitted too.
+        """
+        self.categories = {}
+        self.fill_values = {}
+        for column in self.columns:
+            values = features[column] if column in features.columns else pd.Series(np.nan, index=features.index)
+            if column in CATEGORICAL_COLUMNS:
+                cleaned = _clean_categories(values)
+                # Sorted codes, the same numbering LabelEncoder assigns
+                self.categories[column] = sorted(cleaned.dropna().unique().tolist())
+                mode = cleaned.mode()
+                self.fill_values[column] = float(self.categories[column].index(mode.iloc[0])) if not mode.empty else 0.0
+            else:
+                median = np.nanmedian(_to_numbers(values)) if len(values) else np.nan
+                self.fill_values[column] = 0.0 if np.isnan(median) else float(median)
+
+        # Category codes are compiled before the columns can be encoded
+        self.scaler = None
+        self.selector = None
+        self._compile()
+
+        X = self.encode(features)
+        self.scaler = StandardScaler().fit(X)
+        if y is not None and k is not None:
+            _, self.selector = apply_feature_selection(self.scale(X), y, k=k)
+        self._compile()
+        return self
+
+    def encode(self, features):
+        """Encode and impute all raw columns, shape (n_rows, n_columns)."""
+        return np.column_stack([self._encode_column(features, column) for column in self.columns])
+
+    def scale(self, X):
+        """Standardise a full encoded matrix, as in training."""
+        X = self.scaler.transform(X) if self.scaler is not None else X
+        return np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def transform(self, data):
+        """Raw rows (DataFrame, list of dicts or one dict) -> model input matrix."""
+        if isinstance(data, dict):
+            return self._transform_record(data)
+        if not isinstance(data, pd.DataFrame):
+            data = pd.DataFrame(data)
+
+        X = np.empty((len(data), len(self._selected)), dtype=np.float64)
+        for position, index in enumerate(self._selected):
+            X[:, position] = self._encode_column(data, self.columns[index])
+        return (X - self._offset) / self._scale
+
+    @property
+    def selected_columns(self):
+        return [self.columns[index] for index in self._selected]
+
+    def _compile(self):
+        """Fuse scaler and selector into per-selected-column offset/scale arrays."""
+        n_columns = len(self.columns)
+        selected = self.selector.get_support(indices=True) if self.selector is not None else np.arange(n_columns)
+        offset = self.scaler.mean_ if self.scaler is not None and self.scaler.with_mean else np.zeros(n_columns)
+        scale = self.scaler.scale_ if self.scaler is not None and self.scaler.with_std else np.ones(n_columns)
+        self._selected = np.asarray(selected, dtype=np.int64)
+        self._offset = np.asarray(offset, dtype=np.float64)[self._selected]
+        self._scale = np.asarray(scale, dtype=np.float64)[self._selected]
+        self._codes = {column: {category: code for code, category in enumerate(categories)}
+                       for column, categories in self.categories.items()}
+
+    def _encode_column(self, features, column):
+        fill = self.fill_values.get(column, 0.0)
+        if column not in features.columns:
+            return np.full(len(features), fill)
+        if column in self._codes:
+            encoded = _clean_categories(features[column]).map(self._codes[column])
+        else:
+            encoded = pd.Series(_to_numbers(features[column]), index=features.index)
+        return encoded.astype(np.float64).fillna(fill).to_numpy()
+
+    def _transform_record(self, record):
+        # Plain-Python path for single requests, same rules as _encode_column
+        values = np.empty(len(self._selected), dtype=np.float64)
+        for position, index in enumerate(self._selected):
+            column = self.columns[index]
+            value = record.get(column)
+            if column in self._codes:
+                code = self._codes[column].get(str(value).strip().lower()) if not _is_missing(value) else None
+                value = float(code) if code is not None else None
+            else:
+                value = _number_or_nan(value)
+                value = None if np.isnan(value) else value
+            values[position] = self.fill_values.get(column, 0.0) if value is None else value
+        return ((values - self._offset) / self._scale).reshape(1, -1)
+
+
+def _clean_categories(values):
+    return values.astype('string').str.strip().str.lower()
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def parse_number(value):
+    """Parse one raw numeric value, the single rule for requests, uploads and validation.
+
+    Surrounding whitespace is ignored and missing values (None, NaN, empty or
+    '?') give NaN. Anything else that is not a plain ASCII number, including
+    '1_000', non-ASCII digits and booleans, raises ValueError.
+    """
+    if _is_missing(value):
+        return np.nan
+    if isinstance(value, (bool, np.bool_)):
+        raise ValueError(f'{value!r} is not a number')
+    if isinstance(value, str):
+        cleaned = value.strip()
+        if cleaned in MISSING_TOKENS:
+            return np.nan
+        if not cleaned.isascii() or '_' in cleaned:
+            raise ValueError(f'{value!r} is not a number')
+        return float(cleaned)
+    try:
+        return float(value)
+    except TypeError:
+        raise ValueError(f'{value!r} is not a number') from None
+
+
+def _number_or_nan(value):
+    try:
+        return parse_number(value)
+    except ValueError:
+        return np.nan
+
+
+def _to_numbers(values):
+    # Numeric columns are already parsed; other columns parse each distinct value once
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    codes, uniques = pd.factorize(values)
+    parsed = np.append(np.fromiter(map(_number_or_nan, uniques), dtype=np.float64, count=len(uniques)), np.nan)
+    # Missing values have code -1, which picks the trailing NaN
+    return parsed[codes]
@@ -0,0 +1,201 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from compiled_forest import CompiledForest
+from cross_validation import (LATENCY_BATCH_ROWS, LATENCY_SINGLE_ROWS, fit_fold_pipeline, measure_latency,
+                              transform_encoded)
+from feature_pipeline import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, FeaturePipeline
+
+
+# Raw panels per fold timed through the single-request transform
+TRANSFORM_TIMING_ROWS = 200
+
+
+def feature_ranking(scores):
+    """Column indices from best to worst score, ordered so the first k are SelectKBest's k columns."""
+    # SelectKBest treats NaN scores as the lowest and keeps the later column on a tie
+    scores = np.where(np.isnan(scores), np.finfo(np.float64).min, scores)
+    return np.argsort(scores, kind="mergesort")[::-1]
+
+
+def prepare_folds(X, y, categories, scratch_dir, n_splits=5, random_state=42):
+    """Fit imputation and scaling once per fold and rank every column by its f_classif score.
+
+    The scaled fold matrices keep every column and are saved as .npy files;
+    a k then only selects the first k ranked columns of them, so neither the
+    scores nor the preprocessing are computed again per k.
+    """
+    folds = []
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    for index, (train_rows, val_rows) in enumerate(splitter.split(np.zeros(len(y)), y)):
+        pipeline = fit_fold_pipeline(X[train_rows], y[train_rows], categories, k=len(FEATURE_COLUMNS))
+        fold = {
+            "ranking": feature_ranking(pipeline.selector.scores_).tolist(),
+            "fill_values": pipeline.fill_values,
+            "mean": pipeline.scaler.mean_.tolist(),
+            "scale": pipeline.scaler.scale_.tolist(),
+            "records": _raw_records(X[val_rows[:TRANSFORM_TIMING_ROWS]], categories),
+        }
+        for name, rows in (("train", train_rows), ("val", val_rows)):
+            fold[f"X_{name}"] = os.path.join(scratch_dir, f"fold{index}_X_{name}.npy")
+            fold[f"y_{name}"] = os.path.join(scratch_dir, f"fold{index}_y_{name}.npy")
+            np.save(fold[f"X_{name}"], transform_encoded(pipeline, X[rows]))
+            np.save(fold[f"y_{name}"], y[rows])
+        folds.append(fold)
+    return folds
+
+
+def evaluate_k(k, folds, categories, base_params, forest_params, latency_repeats=3):
+    """Fit the forest on each fold's k best columns; measure accuracy and serving cost.
+
+    Serving cost has three parts: the single-request transform of a raw
+    panel (which encodes k columns), the early-exit forest walk of one row,
+    and the per-row cost of a batch.
+    """
+    accuracies, ckd_recalls, transform_us, single_ms, batch_us, nodes = [], [], [], [], [], []
+    for fold in folds:
+        columns = np.sort(fold["ranking"][:k])
+        X_train = np.asarray(np.load(fold["X_train"], mmap_mode="r")[:, columns])
+        y_train = np.load(fold["y_train"])
+        X_val = np.asarray(np.load(fold["X_val"], mmap_mode="r")[:, columns])
+        y_val = np.load(fold["y_val"])
+
+        model = RandomForestClassifier(**base_params, **forest_params, n_jobs=1).fit(X_train, y_train)
+        compiled = CompiledForest.from_sklearn(model)
+        labels = compiled.predict(X_val)
+        accuracies.append(float((labels == y_val).mean()))
+        # Class 0 is CKD; missing a CKD case is the costly error
+        ckd = y_val == 0
+        ckd_recalls.append(float((labels[ckd] == 0).mean()) if ckd.any() else 0.0)
+        nodes.append(sum(tree.tree_.node_count for tree in model.estimators_))
+
+        latency_ms, batch_us_per_row = measure_latency(
+            compiled, X_val, latency_repeats, LATENCY_SINGLE_ROWS, LATENCY_BATCH_ROWS)
+        single_ms.append(latency_ms)
+        batch_us.append(batch_us_per_row)
+
+        pipeline = FeaturePipeline.from_arrays(FEATURE_COLUMNS, categories, fold["fill_values"], columns,
+                                               np.asarray(fold["mean"])[columns], np.asarray(fold["scale"])[columns])
+        best = float("inf")
+        for _ in range(latency_repeats):
+            started = time.perf_counter()
+            for record in fold["records"]:
+                pipeline.transform(record)
+            best = min(best, time.perf_counter() - started)
+        transform_us.append(best * 1e6 / len(fold["records"]))
+
+    return {
+        "k": k,
+        "accuracy": float(np.mean(accuracies)),
+        "accuracy_std": float(np.std(accuracies)),
+        "ckd_recall": float(np.mean(ckd_recalls)),
+        "transform_us": float(np.mean(transform_us)),
+        "latency_ms": float(np.mean(single_ms)),
+        "request_ms": float(np.mean(transform_us)) / 1000 + float(np.mean(single_ms)),
+        "batch_us_per_row": float(np.mean(batch_us)),
+        "nodes": int(np.mean(nodes)),
+    }
+
+
+def choose_k(results, accuracy_tolerance=0.005):
+    """Smallest k whose accuracy and CKD recall are both within ``accuracy_tolerance`` of the best."""
+    best_accuracy = max(result["accuracy"] for result in results)
+    best_recall = max(result["ckd_recall"] for result in results)
+    for result in sorted(results, key=lambda r: r["k"]):
+        if (result["accuracy"] >= best_accuracy - accuracy_tolerance
+                and result["ckd_recall"] >= best_recall - accuracy_tolerance):
+            return result["k"]
+
+
+def run_sweep(X, y, categories, base_params, forest_params, workers=None, n_splits=5, k_values=None,
+              accuracy_tolerance=0.005, scratch_dir=None):
+    """Cross-validate every k of SelectKBest in a process pool, from encoded rows.
+
+    ``X``, ``y`` and ``categories`` are what ``load_encoded_data`` returns;
+    every k is one pool task that runs all folds.
+    """
+    k_values = list(k_values or range(1, len(FEATURE_COLUMNS) + 1))
+    workers = max(1, workers or os.cpu_count() or 1)
+    y = np.asarray(y)
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="ckd-sweep-", dir=scratch_dir) as scratch:
+        folds = prepare_folds(X, y, categories, scratch, n_splits=n_splits)
+        preprocessing_seconds = time.perf_counter() - started
+
+        args = (folds, categories, base_params, forest_params)
+        if workers == 1:
+            results = [evaluate_k(k, *args) for k in k_values]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(evaluate_k, k, *args) for k in k_values]
+                results = [future.result() for future in futures]
+
+    chosen = choose_k(results, accuracy_tolerance)
+    for result in results:
+        result["chosen"] = result["k"] == chosen
+    return {
+        "rows": len(y),
+        "folds": n_splits,
+        "workers": workers,
+        "base_params": base_params,
+        "forest_params": forest_params,
+        "accuracy_tolerance": accuracy_tolerance,
+        # Columns best first, by their mean rank across folds
+        "ranking": [FEATURE_COLUMNS[index] for index in _consensus_ranking(folds)],
+        "preprocessing_seconds": round(preprocessing_seconds, 3),
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "chosen_k": chosen,
+        "results": results,
+    }
+
+
+def format_report(report):
+    """Plain-text table of a sweep report, one row per k."""
+    lines = [
+        f"k = {report['results'][0]['k']}..{report['results'][-1]['k']} x {report['folds']} folds on "
+        f"{report['rows']} rows, {report['workers']} workers: {report['total_seconds']:.1f}s "
+        f"(preprocessing and scores {report['preprocessing_seconds']:.2f}s)",
+        f"Columns by f_classif score: {', '.join(report['ranking'])}",
+        f"{'k':>3}  {'accuracy':>13}  {'CKD recall':>10}  {'transform us':>12}  {'forest ms':>9}  "
+        f"{'request ms':>10}  {'batch us/row':>12}  {'nodes':>6}",
+    ]
+    for result in report["results"]:
+        lines.append(
+            f"{result['k']:>3}  {result['accuracy']:.4f}+-{result['accuracy_std']:.3f}  "
+            f"{result['ckd_recall']:>10.4f}  {result['transform_us']:>12.1f}  {result['latency_ms']:>9.3f}  "
+            f"{result['request_ms']:>10.3f}  {result['batch_us_per_row']:>12.2f}  {result['nodes']:>6}"
+            f"{'  *' if result['chosen'] else ''}"
+        )
+    lines.append(f"* chosen: smallest k within {report['accuracy_tolerance']:.1%} of the best accuracy "
+                 f"and CKD recall")
+    return "\n".join(lines)
+
+
+def _raw_records(X, categories):
+    # Encoded rows back to request-like panels: category strings, numbers, None where missing
+    records = []
+    for row in X:
+        record = {}
+        for column, value in zip(FEATURE_COLUMNS, row):
+            if np.isnan(value):
+                record[column] = None
+            elif column in CATEGORICAL_COLUMNS:
+                record[column] = categories[column][int(value)]
+            else:
+                record[column] = float(value)
+        records.append(record)
+    return records
+
+
+def _consensus_ranking(folds):
+    positions = np.zeros(len(FEATURE_COLUMNS))
+    for fold in folds:
+        positions[fold["ranking"]] += np.arange(len(FEATURE_COLUMNS))
+    return np.argsort(positions, kind="stable")
@@ -0,0 +1,168 @@
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, recall_score
+from sklearn.model_selection import StratifiedKFold
+
+from compiled_forest import CompiledForest
+from cross_validation import measure_latency
+from feature_pipeline import FeaturePipeline
+
+
+# Forest settings tried by default; every combination is one candidate
+DEFAULT_GRID = {
+    "n_estimators": [50, 100, 200],
+    "max_depth": [6, 15, None],
+    "min_samples_split": [4],
+    "min_samples_leaf": [1, 2, 4],
+}
+
+
+def candidate_params(grid):
+    """Every combination of a parameter grid, as a list of dicts."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def prepare_folds(features, y, scratch_dir, k=15, n_splits=5, random_state=42):
+    """Fit the feature pipeline once per fold and save each fold's matrices as .npy files.
+
+    Returns one dict of file paths per fold. Workers memory-map these files,
+    so preprocessing and feature selection are never repeated per candidate.
+    """
+    folds = []
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    for index, (train_rows, val_rows) in enumerate(splitter.split(features, y)):
+        pipeline = FeaturePipeline().fit(features.iloc[train_rows], y.iloc[train_rows], k=k)
+        paths = {}
+        for name, rows in (("train", train_rows), ("val", val_rows)):
+            paths[f"X_{name}"] = os.path.join(scratch_dir, f"fold{index}_X_{name}.npy")
+            paths[f"y_{name}"] = os.path.join(scratch_dir, f"fold{index}_y_{name}.npy")
+            np.save(paths[f"X_{name}"], pipeline.transform(features.iloc[rows]))
+            np.save(paths[f"y_{name}"], y.iloc[rows].to_numpy())
+        folds.append(paths)
+    return folds
+
+
+def evaluate_candidate(params, base_params, folds, latency_repeats=3):
+    """Fit one candidate on every fold and measure its accuracy and serving latency.
+
+    Latency is timed on the compiled forest the API serves from: the mean
+    single-row time of ``predict_row_early_exit`` and the per-row time of
+    scoring a fold's validation rows as one batch (best of ``latency_repeats``).
+    """
+    accuracies, ckd_recalls, single_ms, batch_us, nodes = [], [], [], [], []
+    for fold in folds:
+        X_train = np.load(fold["X_train"], mmap_mode="r")
+        y_train = np.load(fold["y_train"])
+        X_val = np.asarray(np.load(fold["X_val"], mmap_mode="r"))
+        y_val = np.load(fold["y_val"])
+
+        model = RandomForestClassifier(**base_params, **params, n_jobs=1).fit(X_train, y_train)
+        compiled = CompiledForest.from_sklearn(model)
+        labels = compiled.predict(X_val)
+        accuracies.append(accuracy_score(y_val, labels))
+        # Class 0 is CKD; missing a CKD case is the costly error
+        ckd_recalls.append(recall_score(y_val, labels, pos_label=0, zero_division=0))
+        nodes.append(sum(tree.tree_.node_count for tree in model.estimators_))
+
+        latency_ms, batch_us_per_row = measure_latency(compiled, X_val, latency_repeats)
+        single_ms.append(latency_ms)
+        batch_us.append(batch_us_per_row)
+
+    return {
+        "params": params,
+        "accuracy": float(np.mean(accuracies)),
+        "accuracy_std": float(np.std(accuracies)),
+        "ckd_recall": float(np.mean(ckd_recalls)),
+        "latency_ms": float(np.mean(single_ms)),
+        "batch_us_per_row": float(np.mean(batch_us)),
+        "nodes": int(np.mean(nodes)),
+    }
+
+
+def rank_results(results, accuracy_tolerance=0.005, latency_tolerance=0.1):
+    """Order candidates by accuracy then latency, mark the Pareto front and choose one.
+
+    Candidates whose mean accuracy is within ``accuracy_tolerance`` of the best
+    are eligible. Among those that are within ``latency_tolerance`` (relative)
+    of the fastest eligible one, the most accurate is chosen, so timing noise
+    alone does not trade accuracy away.
+    """
+    ranked = sorted(results, key=lambda r: (-r["accuracy"], r["latency_ms"]))
+    best_accuracy = ranked[0]["accuracy"]
+    for result in ranked:
+        result["pareto"] = not any(
+            other["accuracy"] >= result["accuracy"] and other["latency_ms"] <= result["latency_ms"]
+            and (other["accuracy"] > result["accuracy"] or other["latency_ms"] < result["latency_ms"])
+            for other in ranked
+        )
+        result["chosen"] = False
+    eligible = [r for r in ranked if r["accuracy"] >= best_accuracy - accuracy_tolerance]
+    fastest = min(r["latency_ms"] for r in eligible)
+    near_fastest = [r for r in eligible if r["latency_ms"] <= fastest * (1 + latency_tolerance)]
+    max(near_fastest, key=lambda r: (r["accuracy"], -r["latency_ms"]))["chosen"] = True
+    for rank, result in enumerate(ranked, start=1):
+        result["rank"] = rank
+    return ranked
+
+
+def run_search(features, y, base_params, grid=None, workers=None, k=15, n_splits=5,
+               accuracy_tolerance=0.005, latency_tolerance=0.1, scratch_dir=None):
+    """Cross-validate every grid candidate in a process pool and return a ranked report."""
+    grid = grid or DEFAULT_GRID
+    workers = max(1, workers or os.cpu_count() or 1)
+    candidates = candidate_params(grid)
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="ckd-search-", dir=scratch_dir) as scratch:
+        folds = prepare_folds(features, y, scratch, k=k, n_splits=n_splits)
+        preprocessing_seconds = time.perf_counter() - started
+
+        if workers == 1:
+            results = [evaluate_candidate(params, base_params, folds) for params in candidates]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(evaluate_candidate, params, base_params, folds) for params in candidates]
+                results = [future.result() for future in futures]
+
+    ranked = rank_results(results, accuracy_tolerance, latency_tolerance)
+    return {
+        "rows": len(y),
+        "folds": n_splits,
+        "k": k,
+        "workers": workers,
+        "grid": grid,
+        "base_params": base_params,
+        "accuracy_tolerance": accuracy_tolerance,
+        "latency_tolerance": latency_tolerance,
+        "preprocessing_seconds": round(preprocessing_seconds, 3),
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "chosen": next(result for result in ranked if result["chosen"]),
+        "results": ranked,
+    }
+
+
+def format_report(report):
+    """Plain-text table of a search report, best candidates first."""
+    lines = [
+        f"{len(report['results'])} candidates x {report['folds']} folds on {report['rows']} rows, "
+        f"{report['workers']} workers: {report['total_seconds']:.1f}s "
+        f"(preprocessing {report['preprocessing_seconds']:.2f}s)",
+        f"{'rank':>4}  {'accuracy':>13}  {'CKD recall':>10}  {'single ms':>9}  {'batch us/row':>12}  "
+        f"{'nodes':>6}  params",
+    ]
+    for result in report["results"]:
+        marks = ("*" if result["chosen"] else " ") + ("P" if result["pareto"] else " ")
+        lines.append(
+            f"{result['rank']:>4}  {result['accuracy']:.4f}+-{result['accuracy_std']:.3f}  "
+            f"{result['ckd_recall']:>10.4f}  {result['latency_ms']:>9.3f}  {result['batch_us_per_row']:>12.2f}  "
+            f"{result['nodes']:>6}  {marks} {result['params']}"
+        )
+    lines.append("* chosen (most accurate of the fastest within the accuracy tolerance), P Pareto-optimal")
+    return "\n".join(lines)
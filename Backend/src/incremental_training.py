@@ -0,0 +1,241 @@
+import copy
+import hashlib
+import itertools
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cascade import cascade_predict
+from compiled_forest import CompiledForest
+from feature_pipeline import CONFIRMED_LABELS, FEATURE_COLUMNS
+from model_artifact import read_pickled_artifact
+from preprocess_data import load_raw_data
+from train_model import MODEL_PATH, save_model, split_rows
+
+
+# Confirmed records read from MongoDB per chunk; each chunk with both classes adds trees
+RETRAIN_CHUNK_SIZE = int(os.getenv("RETRAIN_CHUNK_SIZE", "1000"))
+RETRAIN_TREES_PER_CHUNK = int(os.getenv("RETRAIN_TREES_PER_CHUNK", "10"))
+
+# Serving latency grows with the forest; past this size retrain from scratch instead
+RETRAIN_MAX_TREES = int(os.getenv("RETRAIN_MAX_TREES", "400"))
+
+# Every HOLDOUT_EVERY-th confirmed record (by id hash) is never trained on and checks the candidate
+HOLDOUT_EVERY = 5
+MIN_HOLDOUT_ROWS = 20
+
+# How far accuracy or CKD recall may drop against the serving model before publishing is refused
+HOLDOUT_TOLERANCE = 0.01
+
+STATE_PATH = "models/retraining_state.json"
+
+
+def confirmed_chunks(collection, since=None, chunk_size=RETRAIN_CHUNK_SIZE):
+    """Yield lists of confirmed prediction records, oldest confirmation first, through one cursor."""
+    query = {"confirmed_label": {"$in": list(CONFIRMED_LABELS)}}
+    if since is not None:
+        query["confirmed_at"] = {"$gt": since}
+    projection = {field: 1 for field in FEATURE_COLUMNS + ["confirmed_label", "confirmed_at"]}
+    cursor = collection.find(query, projection).sort([("confirmed_at", 1), ("_id", 1)]).batch_size(chunk_size)
+    try:
+        while True:
+            chunk = list(itertools.islice(cursor, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        cursor.close()
+
+
+def is_holdout(record_id):
+    """Stable holdout assignment of a record, so it is never trained on in any run."""
+    digest = hashlib.sha256(str(record_id).encode()).digest()
+    return int.from_bytes(digest[:4], "big") % HOLDOUT_EVERY == 0
+
+
+def load_state(state_path=STATE_PATH):
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if state.get("watermark"):
+        state["watermark"] = datetime.fromisoformat(state["watermark"])
+    return state
+
+
+def save_state(state, state_path=STATE_PATH):
+    state = {**state, "watermark": state["watermark"].isoformat() if state.get("watermark") else None}
+    with open(f"{state_path}.tmp", "w") as f:
+        json.dump(state, f, indent=2, default=str)
+    os.replace(f"{state_path}.tmp", state_path)
+
+
+def served_metrics(forest, cascade, X, y):
+    """Accuracy and CKD recall of the cascade + forest as the API serves them."""
+    if len(y) == 0:
+        return None
+    compiled = CompiledForest.from_sklearn(forest)
+    fallback = lambda rows: (compiled.predict(rows), compiled.predict_proba(rows).max(axis=1))
+    labels = cascade_predict(cascade, X, fallback)[0] if cascade is not None else fallback(X)[0]
+    ckd = y == CONFIRMED_LABELS["CKD"]
+    return {
+        "rows": int(len(y)),
+        "accuracy": float((labels == y).mean()),
+        "ckd_recall": float((labels[ckd] == y[ckd]).mean()) if ckd.any() else None,
+    }
+
+
+def holdout_check(baseline, candidate, tolerance=HOLDOUT_TOLERANCE):
+    """Whether the candidate's metrics are within ``tolerance`` of the baseline's on every checked set."""
+    failures = []
+    for name in baseline:
+        if baseline[name] is None:
+            continue
+        for metric in ("accuracy", "ckd_recall"):
+            before, after = baseline[name][metric], candidate[name][metric]
+            if before is not None and after < before - tolerance:
+                failures.append(f"{name} {metric} {before:.4f} -> {after:.4f}")
+    return not failures, failures
+
+
+def retrain_incrementally(collection, pickle_path=MODEL_PATH, reference_csv="data/kidney_disease.csv",
+                          state_path=STATE_PATH, chunk_size=RETRAIN_CHUNK_SIZE,
+                          trees_per_chunk=RETRAIN_TREES_PER_CHUNK, max_trees=RETRAIN_MAX_TREES,
+                          tolerance=HOLDOUT_TOLERANCE, publish=True, log=print):
+    """Add trees to the serving forest from records confirmed since the last published run.
+
+    Records are read in chunks through a cursor and transformed with the
+    artifact's own pipeline (the stored imputation, scaling and selection, so
+    the new trees see exactly what serving computes). Each chunk with both
+    classes adds ``trees_per_chunk`` trees through ``warm_start``; chunks with
+    one class wait for the next. The existing trees are never refitted.
+    A ``class_weight="balanced"`` forest is grown with the fixed weights of
+    train_model.py's training split, so the new trees weigh the classes as
+    the existing ones do rather than by each chunk's own counts.
+
+    The candidate is compared with the serving model, both as served (cascade
+    first), on the held-out confirmed records and on the test split of
+    ``reference_csv`` that train_model.py holds out. Only if neither accuracy
+    nor CKD recall drops by more than ``tolerance`` is it saved, as a
+    timestamped copy next to ``pickle_path`` and as ``pickle_path`` itself,
+    which the API hot-reloads. The watermark in ``state_path`` only advances
+    on publish, so refused records are tried again with the next run's.
+    """
+    started_at = datetime.utcnow()
+    state = load_state(state_path)
+    saved = read_pickled_artifact(pickle_path)
+    baseline_model, pipeline, cascade = saved["model"], saved["pipeline"], saved["cascade"]
+    model = copy.deepcopy(baseline_model)
+    model.set_params(warm_start=True)
+    baseline_trees = len(model.estimators_)
+
+    # train_model.py's split of the reference data: its training rows set the class weights, its test rows check
+    features, labels = load_raw_data(reference_csv)
+    train_rows, test_rows = split_rows(labels)
+    if isinstance(model.class_weight, str):
+        # "balanced" would re-weight every chunk by its own class counts; keep the existing trees' weights
+        counts = np.bincount(labels.to_numpy()[train_rows], minlength=len(model.classes_))
+        weights = len(train_rows) / (len(model.classes_) * counts)
+        model.set_params(class_weight=dict(zip(model.classes_.tolist(), weights.tolist())))
+
+    holdout_X, holdout_y = [], []
+    pending_X, pending_y = [], []
+    watermark = state.get("watermark")
+    fitted_rows = fitted_chunks = seen = 0
+    reason = "no chunk of newly confirmed records has both classes"
+    for chunk in confirmed_chunks(collection, since=state.get("watermark"), chunk_size=chunk_size):
+        seen += len(chunk)
+        records = pd.DataFrame(chunk, columns=FEATURE_COLUMNS + ["_id", "confirmed_label", "confirmed_at"])
+        X = pipeline.transform(records[FEATURE_COLUMNS])
+        y = records["confirmed_label"].map(CONFIRMED_LABELS).to_numpy()
+        held_out = records["_id"].map(is_holdout).to_numpy(dtype=bool)
+        holdout_X.append(X[held_out])
+        holdout_y.append(y[held_out])
+        pending_X.append(X[~held_out])
+        pending_y.append(y[~held_out])
+
+        batch_y = np.concatenate(pending_y)
+        if len(np.unique(batch_y)) < len(model.classes_):
+            continue
+        if len(model.estimators_) + trees_per_chunk > max_trees:
+            reason = f"the forest would exceed {max_trees} trees, retrain from scratch with train_model.py"
+            log(f"Stopping: {reason}")
+            break
+        model.set_params(n_estimators=len(model.estimators_) + trees_per_chunk)
+        model.fit(np.concatenate(pending_X), batch_y)
+        fitted_rows += len(batch_y)
+        fitted_chunks += 1
+        pending_X, pending_y = [], []
+        watermark = chunk[-1]["confirmed_at"]
+
+    report = {
+        "started_at": started_at.isoformat(),
+        "since": state.get("watermark").isoformat() if state.get("watermark") else None,
+        "confirmed_records": seen,
+        "fitted_rows": fitted_rows,
+        "fitted_chunks": fitted_chunks,
+        "unfitted_rows": int(sum(len(y) for y in pending_y)),
+        "trees": [baseline_trees, len(model.estimators_)],
+        "class_weight": model.class_weight,
+        "published": False,
+    }
+    if fitted_chunks == 0:
+        report["reason"] = reason if seen else "no newly confirmed records"
+        log(f"Nothing to retrain: {report['reason']}")
+        return report
+
+    # Holdout check against the serving model
+    check_sets = {
+        "reference": (pipeline.transform(features.iloc[test_rows]), labels.to_numpy()[test_rows]),
+        "confirmed_holdout": (np.concatenate(holdout_X), np.concatenate(holdout_y)),
+    }
+    if len(check_sets["confirmed_holdout"][1]) < MIN_HOLDOUT_ROWS:
+        log(f"Only {len(check_sets['confirmed_holdout'][1])} held-out confirmed records, "
+            f"checking on the reference split alone")
+        del check_sets["confirmed_holdout"]
+    report["baseline"] = {name: served_metrics(baseline_model, cascade, X, y) for name, (X, y) in check_sets.items()}
+    report["candidate"] = {name: served_metrics(model, cascade, X, y) for name, (X, y) in check_sets.items()}
+    passed, failures = holdout_check(report["baseline"], report["candidate"], tolerance)
+    report["holdout_passed"] = passed
+    report["failures"] = failures
+
+    for name in check_sets:
+        before, after = report["baseline"][name], report["candidate"][name]
+        log(f"{name} ({after['rows']} rows): accuracy {before['accuracy']:.4f} -> {after['accuracy']:.4f}")
+    log(f"{fitted_rows} confirmed records added {len(model.estimators_) - baseline_trees} trees")
+
+    if passed and publish:
+        version_path = f"{os.path.splitext(pickle_path)[0]}-{datetime.utcnow():%Y%m%dT%H%M%S}.pkl"
+        save_model(model, pipeline, cascade, path=version_path)
+        save_model(model, pipeline, cascade, path=pickle_path)
+        report["published"] = True
+        report["artifact"] = version_path
+        save_state({"watermark": watermark, "last_run": report}, state_path)
+        log(f"Holdout check passed, published {version_path}")
+    else:
+        save_state({**state, "last_run": report}, state_path)
+        if passed:
+            log("Holdout check passed, not published (dry run)")
+        else:
+            log(f"Holdout check failed, nothing published: {'; '.join(failures)}")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Add trees to the serving forest from clinician-confirmed predictions")
+    parser.add_argument("--chunk-size", type=int, default=RETRAIN_CHUNK_SIZE)
+    parser.add_argument("--trees-per-chunk", type=int, default=RETRAIN_TREES_PER_CHUNK)
+    parser.add_argument("--dry-run", action="store_true", help="run the holdout check without publishing")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    retrain_incrementally(client["ckd_prediction"]["predictions"], chunk_size=args.chunk_size,
+                          trees_per_chunk=args.trees_per_chunk, publish=not args.dry_run)
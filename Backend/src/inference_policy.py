@@ -0,0 +1,110 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import numpy as np
+
+
+class ParallelInference:
+    """Decides how many threads score one request and runs its row shards.
+
+    The compiled forest spends its time in numpy array operations that release
+    the GIL, so row shards scored on separate threads use separate cores. A
+    request of ``n`` rows gets ``n // min_rows_per_worker`` threads, capped by
+    an equal share of ``max_workers`` among the requests currently scoring.
+    Small requests therefore run serially on the calling thread, and
+    concurrent large batches split the cores instead of oversubscribing them.
+    The calling thread always scores the first shard itself, so a request
+    makes progress even when the shared pool is busy.
+    """
+
+    def __init__(self, max_workers=None, min_rows_per_worker=None):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.min_rows_per_worker = min_rows_per_worker
+        self.calibration = None
+        self._executor = None
+        if self.max_workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers - 1, thread_name_prefix='inference')
+        self._lock = Lock()
+        self._active = 0
+        self.serial_calls = 0
+        self.parallel_calls = 0
+
+    def workers_for(self, n_rows, active=1):
+        """Threads to use for ``n_rows`` rows while ``active`` requests are scoring."""
+        if self._executor is None or not self.min_rows_per_worker:
+            return 1
+        share = max(1, self.max_workers // max(active, 1))
+        return max(1, min(share, n_rows // self.min_rows_per_worker))
+
+    def run(self, score_fn, X):
+        """Score ``X`` with ``score_fn(rows) -> tuple of per-row arrays``, in parallel if worthwhile."""
+        with self._lock:
+            self._active += 1
+            workers = self.workers_for(len(X), self._active)
+            if workers == 1:
+                self.serial_calls += 1
+            else:
+                self.parallel_calls += 1
+        try:
+            if workers == 1:
+                return score_fn(X)
+
+            outputs = self._run_sharded(score_fn, X, workers)
+            return tuple(np.concatenate(parts) for parts in zip(*outputs))
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def calibrate(self, score_fn, n_features, sizes=(512, 2048, 8192, 32768), repeats=3):
+        """Time serial against parallel scoring and set ``min_rows_per_worker``.
+
+        Picks the smallest tested batch that is at least 20% faster when split
+        across every worker. If none is, requests always run serially.
+        """
+        if self._executor is None:
+            self.calibration = {'parallel': False, 'reason': 'single core'}
+            return self.calibration
+
+        X = np.random.default_rng(0).normal(size=(max(sizes), n_features))
+        timings = []
+        chosen = None
+        for size in sizes:
+            rows = X[:size]
+            serial = self._best_time(lambda: score_fn(rows), repeats)
+            parallel = self._best_time(lambda: self._run_sharded(score_fn, rows, self.max_workers), repeats)
+            timings.append({'rows': size, 'serial_ms': round(serial * 1000, 3),
+                            'parallel_ms': round(parallel * 1000, 3)})
+            if parallel < 0.8 * serial:
+                chosen = size
+                break
+
+        self.min_rows_per_worker = chosen // self.max_workers if chosen else None
+        self.calibration = {'parallel': chosen is not None, 'timings': timings}
+        return self.calibration
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'min_rows_per_worker': self.min_rows_per_worker,
+                'active': self._active,
+                'serial_calls': self.serial_calls,
+                'parallel_calls': self.parallel_calls,
+                'calibration': self.calibration
+            }
+
+    def _run_sharded(self, score_fn, X, workers):
+        shards = np.array_split(X, workers)
+        futures = [self._executor.submit(score_fn, shard) for shard in shards[1:]]
+        return [score_fn(shards[0])] + [future.result() for future in futures]
+
+    @staticmethod
+    def _best_time(fn, repeats):
+        best = float('inf')
+        for _ in range(repeats):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        return best
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+from feature_pipeline import FEATURE_COLUMNS, LEGACY_CATEGORIES, MISSING_TOKENS, parse_number
+
+
+# Physiologically plausible limits for the numeric columns (units as in the dataset)
+VALID_RANGES = {
+    'age': (0, 120),          # years
+    'bp': (30, 250),          # mm/Hg
+    'sg': (1.000, 1.040),     # urine specific gravity
+    'al': (0, 5),             # albumin grade
+    'su': (0, 5),             # sugar grade
+    'bgr': (20, 1000),        # blood glucose random, mgs/dl
+    'bu': (1, 500),           # blood urea, mgs/dl
+    'sc': (0.1, 80),          # serum creatinine, mgs/dl
+    'sod': (100, 200),        # sodium, mEq/L
+    'pot': (1.5, 15),         # potassium, mEq/L
+    'hemo': (2, 25),          # haemoglobin, gms
+    'pcv': (5, 70),           # packed cell volume, %
+    'wc': (500, 100000),      # white blood cells, cells/cumm
+    'rc': (1, 10),            # red blood cells, millions/cmm
+}
+
+TYPE_ERROR = 1
+RANGE_ERROR = 2
+CATEGORY_ERROR = 3
+
+ERROR_MESSAGES = {
+    TYPE_ERROR: 'not a number',
+    RANGE_ERROR: 'out of range',
+    CATEGORY_ERROR: 'unknown category',
+}
+
+
+class ValidationResult:
+    """Per-cell error codes for a validated DataFrame.
+
+    ``codes`` is an (n_rows, n_columns) int8 matrix, 0 where the value is
+    usable. Messages are only built for the rows that failed.
+    """
+
+    def __init__(self, frame, columns, codes, categories, ranges):
+        self.frame = frame
+        self.columns = columns
+        self.codes = codes
+        self.categories = categories
+        self.ranges = ranges
+        self.valid_mask = ~codes.any(axis=1)
+
+    def invalid_fields(self, row):
+        return [self.columns[index] for index in np.flatnonzero(self.codes[row])]
+
+    def row_error(self, row):
+        """Readable description of everything wrong with one row."""
+        problems = []
+        for index in np.flatnonzero(self.codes[row]):
+            column = self.columns[index]
+            code = self.codes[row, index]
+            value = self.frame[column].iloc[row]
+            if code == RANGE_ERROR:
+                low, high = self.ranges[column]
+                problems.append(f'{column}={value} {ERROR_MESSAGES[code]} [{low}, {high}]')
+            elif code == CATEGORY_ERROR:
+                allowed = ', '.join(self.categories[column])
+                problems.append(f'{column}={value!r} {ERROR_MESSAGES[code]} (expected {allowed})')
+            else:
+                problems.append(f'{column}={value!r} {ERROR_MESSAGES[code]}')
+        return '; '.join(problems)
+
+    def summary(self):
+        """Count of invalid rows and of each kind of error per column."""
+        by_column = {}
+        for index, column in enumerate(self.columns):
+            counts = np.bincount(self.codes[:, index], minlength=len(ERROR_MESSAGES) + 1)
+            errors = {ERROR_MESSAGES[code]: int(counts[code]) for code in ERROR_MESSAGES if counts[code]}
+            if errors:
+                by_column[column] = errors
+        return {'invalid_rows': int((~self.valid_mask).sum()), 'columns': by_column}
+
+
+def merge_validation_summaries(total, summary):
+    """Add one ``ValidationResult.summary()`` into a running total, in place."""
+    total['invalid_rows'] += summary['invalid_rows']
+    for column, errors in summary['columns'].items():
+        column_total = total['columns'].setdefault(column, {})
+        for message, count in errors.items():
+            column_total[message] = column_total.get(message, 0) + count
+    return total
+
+
+def validate_frame(frame, categories=None, ranges=None, columns=None):
+    """Check every column of an uploaded DataFrame at once.
+
+    Numeric columns must parse as numbers within ``ranges``; categorical
+    columns must hold one of ``categories`` (compared stripped and lower-cased,
+    like the FeaturePipeline encodes them). Missing values and absent columns
+    are allowed, since the pipeline imputes them.
+    """
+    categories = categories or LEGACY_CATEGORIES
+    ranges = VALID_RANGES if ranges is None else ranges
+    columns = list(columns or FEATURE_COLUMNS)
+
+    codes = np.zeros((len(frame), len(columns)), dtype=np.int8)
+    for index, column in enumerate(columns):
+        if column not in frame.columns:
+            continue
+        raw = frame[column]
+
+        if pd.api.types.is_numeric_dtype(raw) and not pd.api.types.is_bool_dtype(raw) \
+                and column not in categories:
+            values = raw.to_numpy(dtype=np.float64)
+        else:
+            # Uploads repeat a handful of distinct strings, so check each distinct value once
+            positions, uniques = pd.factorize(raw, use_na_sentinel=True)
+            if column in categories:
+                unique_codes, unique_values = _check_categories(uniques, categories[column])
+            else:
+                unique_codes, unique_values = _check_numbers(uniques)
+            present = positions >= 0
+            codes[present, index] = unique_codes[positions[present]]
+            values = np.full(len(raw), np.nan)
+            values[present] = unique_values[positions[present]]
+
+        if column in ranges:
+            low, high = ranges[column]
+            with np.errstate(invalid='ignore'):
+                out_of_range = (values < low) | (values > high)
+            codes[out_of_range, index] = RANGE_ERROR
+
+    return ValidationResult(frame, columns, codes, categories, ranges)
+
+
+def _check_categories(uniques, allowed):
+    allowed = set(allowed)
+    unique_codes = np.zeros(len(uniques), dtype=np.int8)
+    for position, value in enumerate(uniques):
+        cleaned = str(value).strip().lower()
+        if cleaned not in MISSING_TOKENS and cleaned not in allowed:
+            unique_codes[position] = CATEGORY_ERROR
+    return unique_codes, np.full(len(uniques), np.nan)
+
+
+def _check_numbers(uniques):
+    unique_codes = np.zeros(len(uniques), dtype=np.int8)
+    unique_values = np.full(len(uniques), np.nan)
+    for position, value in enumerate(uniques):
+        try:
+            unique_values[position] = parse_number(value)
+        except ValueError:
+            unique_codes[position] = TYPE_ERROR
+    return unique_codes, unique_values
@@ -0,0 +1,193 @@
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+from cascade import LinearStage
+from compiled_forest import CompiledForest
+from feature_pipeline import FeaturePipeline
+from prediction_cache import artifact_version
+
+
+# Directory layout: header.json plus one .npy file per array. The .npy files
+# are opened with mmap_mode='r', so every worker process maps the same pages
+# of the OS page cache instead of unpickling its own copy of the forest.
+ARTIFACT_FORMAT = "ckd-forest-mmap"
+SCHEMA_VERSION = 1
+HEADER_FILE = "header.json"
+
+FOREST_ARRAYS = ["children_left", "children_right", "feature", "threshold", "leaf_proba", "roots"]
+PIPELINE_ARRAYS = ["selected", "offset", "scale"]
+
+
+class ArtifactError(Exception):
+    """Raised when a memory-mapped artifact is missing, malformed or unsupported."""
+
+
+def read_pickled_model(pickle_path):
+    """Load ``(model, pipeline)`` from a pickled artifact written by train_model.py."""
+    saved = read_pickled_artifact(pickle_path)
+    return saved["model"], saved["pipeline"]
+
+
+def read_pickled_artifact(pickle_path):
+    """Load a pickled artifact as a dict with ``model``, ``pipeline`` and ``cascade``."""
+    with open(pickle_path, "rb") as f:
+        saved = pickle.load(f)
+
+    # Older artifacts are a bare model, or only carry the scaler and selector
+    if not isinstance(saved, dict):
+        return {"model": saved, "pipeline": FeaturePipeline.from_legacy(), "cascade": None}
+    pipeline = saved.get("pipeline") or FeaturePipeline.from_legacy(saved.get("scaler"), saved.get("selector"))
+    return {"model": saved["model"], "pipeline": pipeline, "cascade": saved.get("cascade")}
+
+
+def export_artifact(pickle_path, output_dir):
+    """Convert a pickled model artifact into the memory-mappable directory format."""
+    saved = read_pickled_artifact(pickle_path)
+    model, pipeline, cascade = saved["model"], saved["pipeline"], saved["cascade"]
+    forest = CompiledForest.from_sklearn(model)
+    selected, offset, scale = pipeline.fused_arrays()
+    arrays = {name: getattr(forest, name) for name in FOREST_ARRAYS}
+    arrays.update({"selected": selected, "offset": offset, "scale": scale})
+
+    header = {
+        "format": ARTIFACT_FORMAT,
+        "schema_version": SCHEMA_VERSION,
+        "model_version": artifact_version(pickle_path),
+        "source": os.path.basename(pickle_path),
+        "created_at": datetime.utcnow().isoformat(),
+        "model_type": type(model).__name__,
+        "n_estimators": forest.n_estimators,
+        "max_depth": forest.max_depth,
+        "classes": np.asarray(forest.classes_).tolist(),
+        "pipeline": {
+            "columns": pipeline.columns,
+            "categories": pipeline.categories,
+            "fill_values": pipeline.fill_values,
+        },
+        "cascade": cascade.to_dict() if cascade is not None else None,
+        "arrays": {},
+    }
+
+    # Write into a sibling directory and swap it in, so readers never see a half-written artifact
+    staging_dir = f"{output_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(staging_dir, f"{name}.npy"), array)
+        header["arrays"][name] = {"file": f"{name}.npy", "dtype": array.dtype.str, "shape": list(array.shape)}
+    with open(os.path.join(staging_dir, HEADER_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+
+    retired_dir = f"{output_dir}.old-{os.getpid()}"
+    if os.path.exists(output_dir):
+        os.replace(output_dir, retired_dir)
+    os.replace(staging_dir, output_dir)
+    shutil.rmtree(retired_dir, ignore_errors=True)
+    return header
+
+
+def read_header(artifact_dir):
+    """Read and validate an artifact's header."""
+    try:
+        with open(os.path.join(artifact_dir, HEADER_FILE)) as f:
+            header = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"Cannot read artifact header in {artifact_dir}: {e}")
+
+    if header.get("format") != ARTIFACT_FORMAT:
+        raise ArtifactError(f"Unknown artifact format: {header.get('format')!r}")
+    if header.get("schema_version") != SCHEMA_VERSION:
+        raise ArtifactError(f"Unsupported artifact schema version: {header.get('schema_version')!r}")
+    return header
+
+
+def load_artifact(artifact_dir):
+    """Map an artifact read-only, returning ``(compiled_forest, pipeline, header)``.
+
+    ``header["cascade"]`` holds the cascade first stage, if the artifact has one.
+    """
+    header = read_header(artifact_dir)
+
+    arrays = {}
+    for name in FOREST_ARRAYS + PIPELINE_ARRAYS:
+        spec = header["arrays"].get(name)
+        if spec is None:
+            raise ArtifactError(f"Artifact is missing array {name!r}")
+        array = np.load(os.path.join(artifact_dir, spec["file"]), mmap_mode="r", allow_pickle=False)
+        if array.dtype.str != spec["dtype"] or list(array.shape) != spec["shape"]:
+            raise ArtifactError(f"Array {name!r} does not match the artifact header")
+        arrays[name] = array
+
+    forest = CompiledForest(
+        children_left=arrays["children_left"],
+        children_right=arrays["children_right"],
+        feature=arrays["feature"],
+        threshold=arrays["threshold"],
+        leaf_proba=arrays["leaf_proba"],
+        roots=arrays["roots"],
+        classes=np.asarray(header["classes"]),
+        max_depth=header["max_depth"],
+    )
+    pipeline = FeaturePipeline.from_arrays(
+        header["pipeline"]["columns"],
+        header["pipeline"]["categories"],
+        header["pipeline"]["fill_values"],
+        arrays["selected"],
+        arrays["offset"],
+        arrays["scale"],
+    )
+    return forest, pipeline, header
+
+
+def load_serving_model(pickle_path):
+    """Load everything needed to serve predictions for a pickled artifact.
+
+    The memory-mapped copy next to the pickle is used when it was exported
+    from the same pickle; otherwise the pickle is loaded and compiled.
+    Returns a dict with ``model``, ``compiled_model``, ``pipeline``,
+    ``cascade``, ``model_version`` and ``source``.
+    """
+    artifact_dir = mmap_path_for(pickle_path)
+    pickle_version = artifact_version(pickle_path) if os.path.exists(pickle_path) else None
+
+    if os.path.isdir(artifact_dir):
+        try:
+            header = read_header(artifact_dir)
+            if pickle_version is None or header["model_version"] == pickle_version:
+                forest, pipeline, header = load_artifact(artifact_dir)
+                cascade = LinearStage.from_dict(header["cascade"]) if header.get("cascade") else None
+                return {"model": forest, "compiled_model": forest, "pipeline": pipeline, "cascade": cascade,
+                        "model_version": header["model_version"], "source": artifact_dir}
+            print(f"Ignoring stale memory-mapped artifact {artifact_dir}")
+        except ArtifactError as e:
+            print(f"Ignoring memory-mapped artifact: {e}")
+
+    saved = read_pickled_artifact(pickle_path)
+    model, pipeline = saved["model"], saved["pipeline"]
+
+    # Flatten the forest into node arrays so inference skips sklearn's per-call overhead
+    try:
+        compiled_model = CompiledForest.from_sklearn(model)
+    except Exception as e:
+        print(f"Serving with sklearn model, forest could not be compiled: {e}")
+        compiled_model = None
+
+    return {"model": model, "compiled_model": compiled_model, "pipeline": pipeline,
+            "cascade": saved["cascade"], "model_version": pickle_version, "source": pickle_path}
+
+
+def mmap_path_for(pickle_path):
+    """Where the memory-mapped copy of a pickled artifact lives."""
+    return os.path.splitext(pickle_path)[0] + ".mmap"
+
+
+if __name__ == "__main__":
+    header = export_artifact("models/random_forest_ckd.pkl", mmap_path_for("models/random_forest_ckd.pkl"))
+    print(f"Exported {header['n_estimators']} trees (model version {header['model_version']}) "
+          f"to {mmap_path_for('models/random_forest_ckd.pkl')}")
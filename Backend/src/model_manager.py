@@ -0,0 +1,197 @@
+import os
+import time
+from datetime import datetime
+from threading import Event, Lock, Thread
+
+from cascade import cascade_predict
+from model_artifact import HEADER_FILE, load_serving_model, mmap_path_for
+
+
+class ServingModel:
+    """One loaded model version: pipeline, optional cascade first stage and (compiled) forest.
+
+    Instances are never mutated after loading, so a request that grabbed one
+    keeps scoring against it even if a newer version is swapped in meanwhile.
+    """
+
+    def __init__(self, model, compiled_model, pipeline, version, source, cascade=None):
+        self.model = model
+        self.compiled_model = compiled_model
+        self.pipeline = pipeline
+        self.cascade = cascade
+        self.version = version
+        self.source = source
+        self.loaded_at = datetime.utcnow()
+
+    def transform(self, data):
+        return self.pipeline.transform(data)
+
+    def score(self, input_matrix):
+        """Score a transformed feature matrix, returning ``(labels, confidences)``.
+
+        With a cascade, rows the first stage is confident about skip the forest.
+        """
+        if self.cascade is not None:
+            labels, confidences, _ = cascade_predict(self.cascade, input_matrix, self.score_forest)
+            return labels, confidences
+        return self.score_forest(input_matrix)
+
+    def score_with_trees(self, input_matrix):
+        """Like ``score``, plus a list with the number of trees each row was scored with.
+
+        Rows a confident cascade first stage answers used 0 trees, the rest the whole forest.
+        """
+        if self.cascade is not None:
+            labels, confidences, needs_fallback = cascade_predict(self.cascade, input_matrix, self.score_forest)
+            return labels, confidences, (needs_fallback * self.n_estimators).tolist()
+        labels, confidences = self.score_forest(input_matrix)
+        return labels, confidences, [self.n_estimators] * len(labels)
+
+    def score_forest(self, input_matrix):
+        if self.compiled_model is not None:
+            predictions, prediction_proba = self.compiled_model.predict_with_proba(input_matrix)
+        else:
+            prediction_proba = self.model.predict_proba(input_matrix)
+            predictions = self.model.classes_[prediction_proba.argmax(axis=1)]
+        return predictions, prediction_proba.max(axis=1)
+
+    def score_one(self, input_row, confidence=None, min_trees=1):
+        """Score one transformed row, returning ``(label, confidence, trees_used)``.
+
+        A confident cascade first stage answers with ``trees_used`` 0.
+        Otherwise the compiled forest stops evaluating trees once the vote is
+        settled (see CompiledForest.predict_row_early_exit); the label is the
+        full forest's unless a ``confidence`` bound is given. The confidence is
+        then the vote share of the ``trees_used`` trees evaluated, which can
+        differ by a few points from the full forest's probability.
+        """
+        if self.cascade is not None:
+            labels, proba = self.cascade.predict_with_proba(input_row)
+            if proba[0].max() >= self.cascade.threshold:
+                return labels[0], float(proba[0].max()), 0
+        if self.compiled_model is None:
+            predictions, confidences = self.score_forest(input_row)
+            return predictions[0], float(confidences[0]), self.n_estimators
+        label, proba, trees_used = self.compiled_model.predict_row_early_exit(
+            input_row, confidence=confidence, min_trees=min_trees)
+        return label, float(proba.max()), trees_used
+
+    @property
+    def n_estimators(self):
+        if self.compiled_model is not None:
+            return self.compiled_model.n_estimators
+        return len(getattr(self.model, 'estimators_', [])) or 1
+
+    def warm_up(self):
+        """Run one prediction so page faults and lazy setup happen before serving."""
+        input_row = self.transform({})
+        self.score(input_row)
+        self.score_forest(input_row)
+        self.score_one(input_row)
+
+
+class ModelManager:
+    """Owns the served model and swaps in new artifacts without a restart.
+
+    ``reload`` loads and warms the artifact on the calling thread, then
+    replaces the current ServingModel in one reference assignment. The
+    optional watcher thread calls it whenever the artifact files change.
+    """
+
+    def __init__(self, pickle_path, poll_seconds=10.0):
+        self.pickle_path = pickle_path
+        self.poll_seconds = poll_seconds
+        self._current = None
+        self._reload_lock = Lock()
+        self._watcher = None
+        self._stop_watching = Event()
+        self._signature = None
+        self.reload_count = 0
+        self.last_error = None
+        self.last_checked_at = None
+
+    def current(self):
+        """The ServingModel to use for the whole of one request (None if nothing is loaded)."""
+        return self._current
+
+    def reload(self, force=False):
+        """Load the artifact from disk and swap it in; returns True if the served model changed."""
+        with self._reload_lock:
+            signature = self._read_signature()
+            try:
+                loaded = load_serving_model(self.pickle_path)
+                candidate = ServingModel(
+                    loaded['model'],
+                    loaded['compiled_model'],
+                    loaded['pipeline'],
+                    loaded['model_version'],
+                    loaded['source'],
+                    loaded['cascade']
+                )
+                candidate.warm_up()
+            except Exception as e:
+                self.last_error = f'{datetime.utcnow().isoformat()}: {e}'
+                raise
+            finally:
+                self._signature = signature
+                self.last_checked_at = datetime.utcnow()
+
+            current = self._current
+            if not force and current is not None and \
+                    (current.version, current.source) == (candidate.version, candidate.source):
+                return False
+
+            self._current = candidate
+            self.reload_count += 1
+            self.last_error = None
+            print(f"Serving model {candidate.version} from {candidate.source}")
+            return True
+
+    def start_watching(self):
+        """Poll the artifact files in a daemon thread and reload when they change."""
+        if self.poll_seconds <= 0 or self._watcher is not None:
+            return
+        self._watcher = Thread(target=self._watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_watching.set()
+
+    def status(self):
+        current = self._current
+        return {
+            'model_version': current.version if current else None,
+            'source': current.source if current else None,
+            'loaded_at': current.loaded_at.isoformat() if current else None,
+            'cascade_threshold': current.cascade.threshold if current and current.cascade else None,
+            'reload_count': self.reload_count,
+            'last_error': self.last_error,
+            'last_checked_at': self.last_checked_at.isoformat() if self.last_checked_at else None,
+            'watching': self._watcher is not None and not self._stop_watching.is_set(),
+            'poll_seconds': self.poll_seconds
+        }
+
+    def _read_signature(self):
+        signature = []
+        for path in (self.pickle_path, os.path.join(mmap_path_for(self.pickle_path), HEADER_FILE)):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _watch(self):
+        while not self._stop_watching.wait(self.poll_seconds):
+            signature = self._read_signature()
+            if signature == self._signature:
+                continue
+
+            # Wait for the writer to finish before loading
+            time.sleep(min(self.poll_seconds, 1.0))
+            if self._read_signature() != signature:
+                continue
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Model reload failed, still serving the previous version: {e}")
@@ -0,0 +1,252 @@
+import os
+import time
+from collections import deque
+from threading import Condition, Lock, Thread
+
+import numpy as np
+
+from model_manager import ModelManager
+
+
+class LatencyStats:
+    """Call count, row count and a rolling window of latencies for one model version."""
+
+    def __init__(self, max_samples=2000):
+        self.calls = 0
+        self.rows = 0
+        self.samples = deque(maxlen=max_samples)
+
+    def record(self, rows, latency_ms):
+        self.calls += 1
+        self.rows += rows
+        self.samples.append(latency_ms)
+
+    def summary(self):
+        if not self.samples:
+            return {'calls': self.calls, 'rows': self.rows, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+        p50, p95, p99 = np.percentile(np.fromiter(self.samples, dtype=np.float64), [50, 95, 99])
+        return {
+            'calls': self.calls,
+            'rows': self.rows,
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3)
+        }
+
+
+class ModelRegistry:
+    """Several model versions loaded side by side.
+
+    The primary model answers requests. Every other registered model is a
+    shadow: ``shadow`` queues the request's raw input and the background
+    thread scores it with the primary and every shadow model, timing each one
+    the same way (transform + score) and counting how often each shadow agrees
+    with the primary. Batch inputs are cut down to a random sample of at most
+    ``shadow_sample_rows`` rows. Requests never wait for shadow scoring; once
+    ``shadow_queue_rows`` rows are queued further samples are dropped and counted.
+    """
+
+    def __init__(self, models_dir, poll_seconds=10.0, shadow_queue_rows=5000, shadow_sample_rows=500,
+                 latency_samples=2000, format_label=str):
+        self.models_dir = os.path.realpath(models_dir)
+        self.format_label = format_label
+        self.poll_seconds = poll_seconds
+        self.latency_samples = latency_samples
+        self._managers = {}
+        self._primary = None
+        self._lock = Lock()
+        self._stats_lock = Lock()
+        self._latency = {}
+        self._agreement = {}
+        self.shadow_dropped = 0
+        self.shadow_errors = 0
+        self.last_shadow_error = None
+        self.shadow_queue_rows = shadow_queue_rows
+        self.shadow_sample_rows = shadow_sample_rows
+        self._queue = deque()
+        self._queued_rows = 0
+        self._queue_ready = Condition(Lock())
+        self._worker = Thread(target=self._run, name='shadow-scorer', daemon=True)
+        self._worker.start()
+
+    def register(self, name, pickle_path, primary=False):
+        """Load a model artifact under ``name``; the first registered model becomes the primary."""
+        path = os.path.realpath(pickle_path)
+        if os.path.dirname(path) != self.models_dir:
+            raise ValueError(f'Model artifacts must live in {self.models_dir}')
+
+        manager = ModelManager(pickle_path, poll_seconds=self.poll_seconds)
+        with self._lock:
+            if name in self._managers:
+                raise ValueError(f'Model {name!r} is already registered')
+            self._managers[name] = manager
+            if primary or self._primary is None:
+                self._primary = name
+
+        try:
+            manager.reload()
+        except Exception:
+            # A failed primary stays registered so the watcher can pick up a fixed artifact
+            if self._primary != name:
+                with self._lock:
+                    self._managers.pop(name, None)
+                raise
+            manager.start_watching()
+            raise
+        manager.start_watching()
+        return manager
+
+    def unregister(self, name):
+        with self._lock:
+            if name not in self._managers:
+                raise KeyError(name)
+            if name == self._primary:
+                raise ValueError('The primary model cannot be removed, promote another model first')
+            manager = self._managers.pop(name)
+        manager.stop_watching()
+
+    def promote(self, name):
+        """Serve ``name`` as the primary; the previous primary keeps running as a shadow."""
+        with self._lock:
+            manager = self._managers.get(name)
+            if manager is None:
+                raise KeyError(name)
+            if manager.current() is None:
+                raise ValueError(f'Model {name!r} is not loaded')
+            self._primary = name
+        self.reset_comparison()
+
+    def primary_manager(self):
+        return self._managers.get(self._primary)
+
+    def current(self):
+        """The primary ServingModel to use for the whole of one request (None if nothing is loaded)."""
+        manager = self.primary_manager()
+        return manager.current() if manager is not None else None
+
+    def shadow(self, kind, data, primary):
+        """Queue raw request input (a payload dict, or a DataFrame for ``kind == 'batch'``) for shadow comparison."""
+        with self._lock:
+            if len(self._managers) < 2:
+                return
+            primary_name = self._primary
+
+        rows = 1
+        if kind == 'batch':
+            if len(data) > self.shadow_sample_rows:
+                data = data.sample(n=self.shadow_sample_rows)
+            rows = len(data)
+
+        with self._queue_ready:
+            if self._queued_rows + rows <= self.shadow_queue_rows:
+                self._queue.append((kind, data, primary_name, primary, rows))
+                self._queued_rows += rows
+                self._queue_ready.notify()
+                return
+        with self._stats_lock:
+            self.shadow_dropped += 1
+
+    def reset_comparison(self):
+        with self._stats_lock:
+            self._latency.clear()
+            self._agreement.clear()
+            self.shadow_dropped = 0
+            self.shadow_errors = 0
+            self.last_shadow_error = None
+
+    def status(self):
+        with self._lock:
+            managers = dict(self._managers)
+            primary_name = self._primary
+
+        models = []
+        for name, manager in managers.items():
+            models.append({'name': name, 'role': 'primary' if name == primary_name else 'shadow',
+                           **manager.status()})
+
+        with self._queue_ready:
+            queued, queued_rows = len(self._queue), self._queued_rows
+
+        with self._stats_lock:
+            latency = [
+                {'model': name, 'model_version': version, 'kind': kind, **stats.summary()}
+                for (name, version, kind), stats in self._latency.items()
+            ]
+            agreement = [
+                {
+                    'model': name,
+                    'model_version': version,
+                    'primary': primary,
+                    'primary_version': primary_version,
+                    'rows': counts['rows'],
+                    'agreed': counts['agreed'],
+                    'agreement_rate': round(counts['agreed'] / counts['rows'], 4) if counts['rows'] else None,
+                    'disagreements': dict(counts['disagreements'])
+                }
+                for (name, version, primary, primary_version), counts in self._agreement.items()
+            ]
+            shadow = {
+                'queued': queued,
+                'queued_rows': queued_rows,
+                'dropped': self.shadow_dropped,
+                'errors': self.shadow_errors,
+                'last_error': self.last_shadow_error
+            }
+
+        return {'primary': primary_name, 'models': models, 'latency': latency,
+                'agreement': agreement, 'shadow': shadow}
+
+    def _score_timed(self, name, kind, serving, data):
+        started = time.perf_counter()
+        input_matrix = serving.transform(data)
+        valid_mask = np.isfinite(input_matrix).all(axis=1)
+        labels = np.empty(len(input_matrix), dtype=object)
+        if valid_mask.any():
+            labels[valid_mask] = serving.score(input_matrix[valid_mask])[0]
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        with self._stats_lock:
+            key = (name, serving.version, kind)
+            if key not in self._latency:
+                self._latency[key] = LatencyStats(self.latency_samples)
+            self._latency[key].record(len(input_matrix), latency_ms)
+        return labels, valid_mask
+
+    def _compare(self, kind, data, primary_name, primary):
+        primary_labels, primary_valid = self._score_timed(primary_name, kind, primary, data)
+
+        with self._lock:
+            shadows = [(name, manager) for name, manager in self._managers.items() if name != primary_name]
+
+        for name, manager in shadows:
+            serving = manager.current()
+            if serving is None:
+                continue
+            labels, valid_mask = self._score_timed(name, kind, serving, data)
+
+            both_valid = primary_valid & valid_mask
+            pairs = zip(primary_labels[both_valid], labels[both_valid])
+            with self._stats_lock:
+                key = (name, serving.version, primary_name, primary.version)
+                counts = self._agreement.setdefault(key, {'rows': 0, 'agreed': 0, 'disagreements': {}})
+                for primary_label, label in pairs:
+                    counts['rows'] += 1
+                    if primary_label == label:
+                        counts['agreed'] += 1
+                    else:
+                        pair = f'{self.format_label(primary_label)} -> {self.format_label(label)}'
+                        counts['disagreements'][pair] = counts['disagreements'].get(pair, 0) + 1
+
+    def _run(self):
+        while True:
+            with self._queue_ready:
+                while not self._queue:
+                    self._queue_ready.wait()
+                kind, data, primary_name, primary, rows = self._queue.popleft()
+                self._queued_rows -= rows
+            try:
+                self._compare(kind, data, primary_name, primary)
+            except Exception as e:
+                with self._stats_lock:
+                    self.shadow_errors += 1
+                    self.last_shadow_error = str(e)
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+
+class PredictionCache:
+    """Thread-safe LRU + TTL cache of prediction results.
+
+    Keys combine the model version with the transformed feature vector, so a
+    resubmitted panel (however its values were formatted) maps to the same
+    entry. The cache empties itself when the model version or the artifact
+    file on disk changes.
+
+    With ``max_weight`` set, each entry also carries a weight (e.g. the rows
+    of a batch result) and least recently used entries are evicted until the
+    total fits; an entry heavier than ``max_weight`` is not stored.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600, artifact_path=None, max_weight=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.artifact_path = artifact_path
+        self.max_weight = max_weight
+        self._entries = OrderedDict()
+        self._weight = 0
+        self._lock = Lock()
+        self._version = None
+        self._artifact_signature = self._read_artifact_signature()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(feature_vector, model_version):
+        # Adding 0.0 folds -0.0 into 0.0 so equal vectors have equal bytes
+        vector = np.ascontiguousarray(feature_vector, dtype=np.float64).ravel() + 0.0
+        return model_version, vector.tobytes()
+
+    def get(self, key):
+        self._check_artifact()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, stored_at, weight = entry
+            if now - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self._weight -= weight
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, weight=1):
+        if self.max_entries <= 0 or (self.max_weight is not None and weight > self.max_weight):
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._weight -= previous[2]
+            self._entries[key] = (value, time.monotonic(), weight)
+            self._weight += weight
+            while len(self._entries) > self.max_entries or (
+                    self.max_weight is not None and self._weight > self.max_weight):
+                self._weight -= self._entries.popitem(last=False)[1][2]
+                self.evictions += 1
+
+    def ensure_version(self, model_version):
+        """Drop every entry if the served model version has changed."""
+        with self._lock:
+            if self._version == model_version:
+                return
+            changed = self._version is not None
+            self._version = model_version
+        if changed:
+            self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'weight': self._weight,
+                'max_weight': self.max_weight,
+                'ttl_seconds': self.ttl_seconds,
+                'model_version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+    def _read_artifact_signature(self):
+        if not self.artifact_path:
+            return None
+        try:
+            stat = os.stat(self.artifact_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _check_artifact(self):
+        signature = self._read_artifact_signature()
+        if signature != self._artifact_signature:
+            self._artifact_signature = signature
+            self.invalidate()
+
+
+def artifact_version(path):
+    """Short content hash identifying a model artifact file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
@@ -1,68 +1,168 @@
-import pandas as pd
 import numpy as np
+import pandas as pd
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 
+from feature_pipeline import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, FeaturePipeline
+
+
+NUMERIC_COLUMNS = [column for column in FEATURE_COLUMNS if column not in CATEGORICAL_COLUMNS]
+
+# Column types applied while the CSV is parsed. Numeric columns go straight to
+# float64 (the float parser skips the stray tabs in values like "\t43");
+# categorical columns and the label become pandas categoricals, so cleaning and
+# encoding work on the handful of distinct values instead of every cell.
+CSV_SCHEMA = {
+    **{column: "float64" for column in NUMERIC_COLUMNS},
+    **{column: "category" for column in CATEGORICAL_COLUMNS},
+    "classification": "category",
+}
+
+# Tokens the dataset uses for "not measured"
+NA_TOKENS = ["?", "\t?", " ?", "", " ", "\t"]
+
+
+def read_typed_csv(csv_path):
+    """Parse the schema columns of a dataset CSV with their final types; other columns are skipped."""
+    options = {"na_values": NA_TOKENS, "usecols": lambda column: column in CSV_SCHEMA}
+    try:
+        return pd.read_csv(csv_path, dtype=CSV_SCHEMA, **options)
+    except ValueError:
+        # Some numeric cell is not a number: parse those columns as text and coerce it to NaN
+        text_schema = {**CSV_SCHEMA, **{column: "string" for column in NUMERIC_COLUMNS}}
+        df = pd.read_csv(csv_path, dtype=text_schema, **options)
+        for column in NUMERIC_COLUMNS:
+            if column in df.columns:
+                df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+        return df
+
+
+def iter_typed_csv(csv_path, chunksize):
+    """Yield typed DataFrames of at most ``chunksize`` rows, for files too large to load at once.
+
+    Numeric columns are parsed as text and coerced, since a bad cell can only
+    be recovered from before a chunk is returned.
+    """
+    text_schema = {**CSV_SCHEMA, **{column: "string" for column in NUMERIC_COLUMNS}}
+    reader = pd.read_csv(csv_path, dtype=text_schema, na_values=NA_TOKENS, chunksize=chunksize,
+                         usecols=lambda column: column in CSV_SCHEMA)
+    for chunk in reader:
+        for column in NUMERIC_COLUMNS:
+            if column in chunk.columns:
+                chunk[column] = pd.to_numeric(chunk[column], errors="coerce").astype("float64")
+        yield chunk
+
+
+def load_raw_data(csv_path):
+    df = read_typed_csv(csv_path)
+
+    # Clean classification labels - remove whitespace, then encode (ckd=0, notckd=1)
+    y = pd.Series(_encode_labels(df["classification"]), index=df.index, name="classification")
+
+    return df.drop("classification", axis=1), y
+
+
+def load_encoded_data(csv_path):
+    """Parse a dataset CSV into ``(X, y, categories)`` without fitting anything.
+
+    ``X`` is a float64 matrix of every FEATURE_COLUMNS column: numeric values
+    as parsed, categorical columns as codes into ``categories[column]`` (the
+    sorted cleaned values), and NaN wherever a value is missing.
+    """
+    df = read_typed_csv(csv_path)
+    y = pd.Series(_encode_labels(df["classification"]), index=df.index, name="classification")
+
+    X = np.full((len(df), len(FEATURE_COLUMNS)), np.nan)
+    categories = {}
+
+    # Numeric block: one copy into the matrix
+    numeric = [FEATURE_COLUMNS.index(column) for column in NUMERIC_COLUMNS if column in df.columns]
+    if numeric:
+        X[:, numeric] = df[[FEATURE_COLUMNS[index] for index in numeric]].to_numpy(dtype=np.float64)
 
-def load_and_preprocess_data(csv_path):
-    df = pd.read_csv(csv_path)
-    
-    # Drop ID column if it exists
-    if 'id' in df.columns:
-        df = df.drop('id', axis=1)
-
-    # Clean classification column - remove whitespace
-    if 'classification' in df.columns:
-        df['classification'] = df['classification'].str.strip()
-
-    # Replace '?' with NaN and \t with ''
-    df = df.replace(['?', '\t', ' '], np.nan)
-
-    # Convert numeric columns
-    for col in df.columns:
-        if col != 'classification':
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    # Fill missing values for numeric columns
-    for col in df.select_dtypes(include=['float64', 'int64']).columns:
-        if df[col].isnull().all():
-            # If entire column is NaN, fill with 0
-            df[col] = 0
-        else:
-            # Fill with median to be more robust to outliers
-            df[col] = df[col].fillna(df[col].median())
-
-    # Fill missing values for categorical columns
-    for col in df.select_dtypes(include=['object']).columns:
-        if col != 'classification':
-            if df[col].isnull().all():
-                df[col] = 'unknown'
-            elif not df[col].mode().empty:
-                df[col] = df[col].fillna(df[col].mode()[0])
-            else:
-                df[col] = df[col].fillna('unknown')
-
-    # Encode categorical data
-    le = LabelEncoder()
-    for col in df.select_dtypes(include=['object']).columns:
-        df[col] = le.fit_transform(df[col])
-
-    # Split X and y
-    X = df.drop('classification', axis=1)
-    y = df['classification']
-
-    # Remove any remaining NaN values
-    X = X.fillna(0)
-
-    # Scale features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    
-    # Final check - replace any NaN or inf with 0
-    X_scaled = np.nan_to_num(X_scaled, nan=0.0, posinf=0.0, neginf=0.0)
+    # Categorical columns: codes into the sorted cleaned categories
+    for column in CATEGORICAL_COLUMNS:
+        if column not in df.columns:
+            continue
+        codes, categories[column] = category_codes(df[column])
+        present = codes >= 0
+        X[present, FEATURE_COLUMNS.index(column)] = codes[present]
+
+    return X, y, categories
+
+
+def imputation_values(X):
+    """Fill value of every column of an encoded matrix, as FeaturePipeline.fit learns them.
+
+    Numeric columns get their median and categorical columns their most
+    frequent code; a column with no values gets 0.
+    """
+    fill_values = np.zeros(X.shape[1])
+
+    # Numeric block: column medians in one call
+    numeric = np.array([FEATURE_COLUMNS.index(column) for column in NUMERIC_COLUMNS])
+    observed = ~np.isnan(X[:, numeric]).all(axis=0)
+    if observed.any():
+        fill_values[numeric[observed]] = np.nanmedian(X[:, numeric[observed]], axis=0)
+
+    # Categorical columns: mode by bincount
+    for column in CATEGORICAL_COLUMNS:
+        index = FEATURE_COLUMNS.index(column)
+        codes = X[:, index]
+        codes = codes[~np.isnan(codes)].astype(np.int64)
+        if len(codes):
+            fill_values[index] = np.bincount(codes).argmax()
+
+    return fill_values
+
+
+def load_and_preprocess_data(csv_path, dtype=np.float32):
+    """Load, impute, encode and standardise every feature column of a dataset CSV.
+
+    Returns ``(X_scaled, y, scaler)`` with the same values, codes and scaling
+    FeaturePipeline fits, as a ``dtype`` matrix (float32 by default, which is
+    what the forest trains on anyway). Statistics are computed in float64.
+    """
+    X, y, _ = load_encoded_data(csv_path)
+
+    # Impute and standardise in place, then convert once
+    fill_values = imputation_values(X)
+    np.copyto(X, np.broadcast_to(fill_values, X.shape), where=np.isnan(X))
+    scaler = StandardScaler().fit(X)
+    X -= scaler.mean_
+    X /= scaler.scale_
+    X_scaled = np.nan_to_num(X.astype(dtype, copy=False), nan=0.0, posinf=0.0, neginf=0.0, copy=False)
 
     return X_scaled, y, scaler
 
 
+def load_and_fit_pipeline(csv_path, k=15):
+    """Fit the full serving pipeline (including SelectKBest) on a training CSV."""
+    features, y = load_raw_data(csv_path)
+    pipeline = FeaturePipeline().fit(features, y, k=k)
+    return pipeline.transform(features), y, pipeline
+
+
+def category_codes(values):
+    """Codes of a categorical column into its sorted, stripped and lower-cased categories (-1 if missing)."""
+    cleaned = values.cat.categories.astype(str).str.strip().str.lower()
+    categories, remap = np.unique(np.asarray(cleaned, dtype=object), return_inverse=True)
+    raw_codes = values.cat.codes.to_numpy()
+    codes = np.where(raw_codes >= 0, remap.ravel()[raw_codes], -1)
+    return codes, categories.tolist()
+
+
+def clean_labels(values):
+    """Label strings of a categorical classification column, stripped of whitespace."""
+    if values.isna().any():
+        raise ValueError(f"{int(values.isna().sum())} rows have no classification")
+    return values.cat.categories.astype(str).str.strip()[values.cat.codes.to_numpy()]
+
+
+def _encode_labels(values):
+    labels = clean_labels(values)
+    return LabelEncoder().fit(labels).transform(labels)
+
+
 if __name__ == "__main__":
     X, y, _ = load_and_preprocess_data("data/kidney_disease.csv")
     print("Preprocessing done. Shape:", X.shape)
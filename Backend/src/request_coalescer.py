@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import Future
+from queue import Empty, Queue
+from threading import Lock, Thread
+
+import numpy as np
+
+
+class PredictionCoalescer:
+    """Merge concurrent single-row predictions into one matrix inference.
+
+    Callers block in ``predict``. A background thread takes the first waiting
+    row, keeps collecting rows for up to ``window_ms`` (or until
+    ``max_batch_size`` rows are queued), scores the rows of each model with a
+    single ``score_fn(model, matrix) -> (labels, confidences, ...)`` call and
+    hands each caller its own row of the result, including any further per-row
+    values ``score_fn`` returns. A request therefore waits at most one window
+    plus one batched inference.
+    """
+
+    def __init__(self, score_fn, window_ms=2.0, max_batch_size=64):
+        self.score_fn = score_fn
+        self.window_seconds = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = Queue()
+        self._stats_lock = Lock()
+        self.batches = 0
+        self.requests = 0
+        self.largest_batch = 0
+        self._worker = Thread(target=self._run, name="prediction-coalescer", daemon=True)
+        self._worker.start()
+
+    def predict(self, feature_vector, model=None, timeout=None):
+        """Score one transformed feature row with ``model``, returning ``(label, confidence, ...)``."""
+        future = Future()
+        self._queue.put((np.asarray(feature_vector, dtype=np.float64).ravel(), model, future))
+        return future.result(timeout=timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "window_ms": self.window_seconds * 1000.0,
+                "max_batch_size": self.max_batch_size,
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+            }
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        deadline = time.monotonic() + self.window_seconds
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+
+            # Rows transformed by different model versions are never scored together
+            groups = {}
+            for row, model, future in pending:
+                groups.setdefault(id(model), (model, [], []))
+                groups[id(model)][1].append(row)
+                groups[id(model)][2].append(future)
+
+            for model, rows, futures in groups.values():
+                try:
+                    labels, confidences, *extra = self.score_fn(model, np.vstack(rows))
+                except Exception as e:
+                    for future in futures:
+                        future.set_exception(e)
+                    continue
+
+                for index, future in enumerate(futures):
+                    future.set_result((labels[index], float(confidences[index]),
+                                       *(values[index] for values in extra)))
+
+            with self._stats_lock:
+                self.batches += 1
+                self.requests += len(pending)
+                self.largest_batch = max(self.largest_batch, len(pending))
@@ -0,0 +1,270 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from queue import Empty, Queue
+from threading import Event, Lock, Timer
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+# A worker that takes longer than this to load the model or score its shard is killed and replaced
+SHARD_REPLY_TIMEOUT_SECONDS = float(os.getenv("SHARD_REPLY_TIMEOUT_SECONDS", "300"))
+
+
+class ShardWorker:
+    """One long-lived worker process speaking JSON lines over stdin/stdout.
+
+    ``reply_pending`` is set while the worker owes a reply; a worker left in
+    that state must be restarted, or its late reply would answer the next task.
+    """
+
+    def __init__(self, pickle_path, reply_timeout=SHARD_REPLY_TIMEOUT_SECONDS):
+        self.pickle_path = pickle_path
+        self.reply_timeout = reply_timeout
+        self.process = None
+        self.model_version = None
+        self.reply_pending = False
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, self.pickle_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        # The worker announces its model version once it has loaded
+        self.reply_pending = True
+        self.model_version = self.receive().get("model_version")
+
+    def restart(self):
+        self.kill()
+        self.start()
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def send(self, message):
+        self.reply_pending = True
+        self.process.stdin.write(json.dumps(message) + "\n")
+        self.process.stdin.flush()
+
+    def receive(self):
+        # Killing a worker that does not answer in time ends the blocking read with EOF
+        expired = Event()
+
+        def expire():
+            expired.set()
+            self.process.kill()
+
+        timer = Timer(self.reply_timeout, expire)
+        timer.daemon = True
+        timer.start()
+        try:
+            line = self.process.stdout.readline()
+        finally:
+            timer.cancel()
+
+        if expired.is_set():
+            raise RuntimeError(f"Shard worker did not reply within {self.reply_timeout:g}s and was killed")
+        if not line:
+            raise RuntimeError(f"Shard worker exited with code {self.process.poll()}")
+        try:
+            reply = json.loads(line)
+        except ValueError as e:
+            raise RuntimeError(f"Shard worker sent an unreadable reply: {line[:200]!r}") from e
+        self.reply_pending = False
+        if reply.get("error"):
+            raise RuntimeError(f"Shard worker failed: {reply['error']}")
+        return reply
+
+    def kill(self):
+        if self.process is None:
+            return
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def stop(self):
+        if self.alive():
+            self.process.stdin.close()
+            self.process.wait(timeout=10)
+
+
+class ShardedInferencePool:
+    """Score very large matrices in worker processes that keep the model loaded.
+
+    The parent writes the transformed feature matrix once to a ``.npy`` file
+    in ``scratch_dir`` (``/dev/shm`` when available, so it stays in RAM) and
+    creates two output files. Each worker maps them, scores its row range and
+    writes labels and confidences in place, so only small JSON messages cross
+    the pipes. Workers load the memory-mapped artifact, so N processes share one
+    copy of the forest, and they reload when asked for a model version they do
+    not have. Labels are stored as int64 (the encoded class ids).
+    """
+
+    def __init__(self, pickle_path, processes, scratch_dir=None, reply_timeout=SHARD_REPLY_TIMEOUT_SECONDS):
+        self.pickle_path = pickle_path
+        self.processes = processes
+        self.reply_timeout = reply_timeout
+        self.scratch_dir = scratch_dir or ("/dev/shm" if os.path.isdir("/dev/shm") else None)
+        self._workers = []
+        self._idle = Queue()
+        self._lock = Lock()
+        self.calls = 0
+        self.rows = 0
+        self.failures = 0
+
+    def start(self):
+        for _ in range(self.processes):
+            worker = ShardWorker(self.pickle_path, self.reply_timeout)
+            worker.start()
+            self._workers.append(worker)
+            self._idle.put(worker)
+        return self
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+
+    def score(self, input_matrix, model_version, pickle_path=None):
+        """Score ``input_matrix`` across the idle workers, returning ``(labels, confidences)``."""
+        input_matrix = np.asarray(input_matrix, dtype=np.float64)
+        n_rows = len(input_matrix)
+
+        # Wait for one worker, then take every other idle one
+        workers = [self._idle.get()]
+        while len(workers) < self.processes:
+            try:
+                workers.append(self._idle.get_nowait())
+            except Empty:
+                break
+
+        try:
+            with tempfile.TemporaryDirectory(prefix="ckd-shards-", dir=self.scratch_dir) as scratch:
+                paths = {name: os.path.join(scratch, f"{name}.npy") for name in ("input", "labels", "confidences")}
+                shared_input = open_memmap(paths["input"], mode="w+", dtype=np.float64, shape=input_matrix.shape)
+                shared_input[:] = input_matrix
+                shared_input.flush()
+                del shared_input
+                open_memmap(paths["labels"], mode="w+", dtype=np.int64, shape=(n_rows,)).flush()
+                open_memmap(paths["confidences"], mode="w+", dtype=np.float64, shape=(n_rows,)).flush()
+
+                bounds = np.linspace(0, n_rows, len(workers) + 1).astype(int)
+                sent = []
+                errors = []
+                for worker, start, stop in zip(workers, bounds[:-1], bounds[1:]):
+                    try:
+                        worker.send({
+                            "pickle_path": pickle_path or self.pickle_path,
+                            "model_version": model_version,
+                            "start": int(start),
+                            "stop": int(stop),
+                            **paths
+                        })
+                        sent.append(worker)
+                    except OSError as e:
+                        errors.append(str(e))
+                for worker in sent:
+                    try:
+                        worker.model_version = worker.receive().get("model_version")
+                    except RuntimeError as e:
+                        errors.append(str(e))
+
+                if errors:
+                    with self._lock:
+                        self.failures += 1
+                    raise RuntimeError("; ".join(errors))
+
+                labels = np.array(np.load(paths["labels"], mmap_mode="r"))
+                confidences = np.array(np.load(paths["confidences"], mmap_mode="r"))
+        finally:
+            for worker in workers:
+                # A worker whose reply was not read would hand it to the next call instead of its own
+                if worker.reply_pending or not worker.alive():
+                    try:
+                        worker.restart()
+                    except Exception as e:
+                        print(f"Could not restart shard worker: {e}")
+                self._idle.put(worker)
+
+        with self._lock:
+            self.calls += 1
+            self.rows += n_rows
+        return labels, confidences
+
+    def stats(self):
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "idle": self._idle.qsize(),
+                "scratch_dir": self.scratch_dir,
+                "calls": self.calls,
+                "rows": self.rows,
+                "failures": self.failures,
+                "worker_versions": [worker.model_version for worker in self._workers],
+            }
+
+
+def run_worker(pickle_path):
+    """Worker process loop: load the model, then score one shard per stdin line."""
+    from model_manager import ModelManager
+
+    # Model loading prints progress; keep stdout for replies only
+    replies = sys.stdout
+    sys.stdout = sys.stderr
+
+    def reply(message):
+        replies.write(json.dumps(message) + "\n")
+        replies.flush()
+
+    managers = {}
+
+    def serving_for(path, version):
+        manager = managers.get(path)
+        if manager is None:
+            manager = managers[path] = ModelManager(path, poll_seconds=0)
+            manager.reload()
+        if version is not None and manager.current().version != version:
+            manager.reload()
+        serving = manager.current()
+        if version is not None and serving.version != version:
+            raise RuntimeError(f"model version {version} is no longer on disk (found {serving.version})")
+        return serving
+
+    reply({"model_version": serving_for(pickle_path, None).version})
+
+    for line in sys.stdin:
+        try:
+            task = json.loads(line)
+            serving = serving_for(task["pickle_path"], task["model_version"])
+            start, stop = task["start"], task["stop"]
+
+            input_matrix = np.load(task["input"], mmap_mode="r")
+            labels, confidences = serving.score(np.asarray(input_matrix[start:stop]))
+
+            shared_labels = np.load(task["labels"], mmap_mode="r+")
+            shared_confidences = np.load(task["confidences"], mmap_mode="r+")
+            shared_labels[start:stop] = labels
+            shared_confidences[start:stop] = confidences
+            shared_labels.flush()
+            shared_confidences.flush()
+            del input_matrix, shared_labels, shared_confidences
+
+            reply({"model_version": serving.version, "rows": stop - start})
+        except Exception as e:
+            reply({"error": str(e)})
+
+
+if __name__ == "__main__":
+    run_worker(sys.argv[1])
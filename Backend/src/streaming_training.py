@@ -0,0 +1,255 @@
+import time
+from collections import Counter
+
+import numpy as np
+from scipy import stats
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_selection import SelectKBest, f_classif
+from sklearn.preprocessing import StandardScaler
+
+from cascade import fit_cascade
+from feature_pipeline import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, FeaturePipeline
+from preprocess_data import NUMERIC_COLUMNS, category_codes, clean_labels, iter_typed_csv
+
+
+# Rows per chunk read from the CSV; peak memory grows with this, not with the file
+DEFAULT_CHUNK_SIZE = 100000
+
+# Every HOLDOUT_EVERY-th row is held out for evaluation and never used for fitting
+HOLDOUT_EVERY = 5
+
+# Training rows kept (uniformly at random) to calibrate the cascade first stage
+CASCADE_SAMPLE_ROWS = 20000
+
+
+class QuantileSketch:
+    """Streaming quantile summary of one numeric column (a KLL-style compactor stack).
+
+    Values enter level 0. A level that holds more than ``capacity`` values is
+    sorted and every other value (random offset) moves up one level, where it
+    stands for twice as many rows. Memory stays O(capacity * log(n / capacity))
+    and a quantile's rank error is a small fraction of a percent; while no level
+    has been compacted the sketch holds every value and answers exactly.
+    """
+
+    def __init__(self, capacity=4096, seed=0):
+        self.capacity = capacity
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compact()
+        return self
+
+    def quantile(self, q):
+        """Value at quantile ``q``, or None if no value was seen."""
+        if self.count == 0:
+            return None
+        if len(self.levels) == 1:
+            # Nothing discarded yet: interpolate like pandas' median
+            return float(np.quantile(self.levels[0], q))
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** height) for height, level in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative, q * cumulative[-1])
+        return float(values[order][min(position, len(values) - 1)])
+
+    def _compact(self):
+        height = 0
+        while height < len(self.levels):
+            level = self.levels[height]
+            if len(level) > self.capacity:
+                level = np.sort(level)
+                # An odd value out stays behind, so every promoted value stands for exactly two
+                kept = level[-1:] if len(level) % 2 else level[:0]
+                paired = level[:len(level) - len(kept)]
+                promoted = paired[self._rng.integers(2)::2]
+                if height + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[height] = kept
+                self.levels[height + 1] = np.concatenate([self.levels[height + 1], promoted])
+            height += 1
+
+
+def train_out_of_core(csv_path, base_params, forest_params, k=15, chunksize=DEFAULT_CHUNK_SIZE,
+                      holdout_every=HOLDOUT_EVERY, cascade_sample_rows=CASCADE_SAMPLE_ROWS,
+                      target_agreement=0.999, log=print):
+    """Fit the serving pipeline and forest on a CSV too large to load, one chunk at a time.
+
+    The file is read four times and never more than one chunk (plus a small
+    sample) is held in memory:
+
+    1. medians (quantile sketches), category modes and class counts;
+    2. scaler (``partial_fit``) and per-class feature sums, from which the
+       SelectKBest ANOVA F-scores are computed exactly;
+    3. the forest grows with ``warm_start``: each chunk adds trees in
+       proportion to its rows, each tree fitted on a bootstrap of that chunk.
+       ``class_weight="balanced"`` is replaced by the weights of the whole
+       file, so every chunk is weighted the same way;
+    4. every ``holdout_every``-th row, skipped by passes 1-3, is scored.
+
+    Rows should be in no particular order with respect to the label: a chunk
+    with one class is held back until a chunk with the other arrives (trailing
+    rows of one class are fitted together with the cascade sample), so a file
+    sorted by label ends up fitted as a few very large chunks.
+
+    Returns ``(model, pipeline, cascade, report)``, the objects train_model.py
+    saves.
+    """
+    started = time.perf_counter()
+
+    def chunks():
+        # (training rows, held-out rows) of each chunk
+        offset = 0
+        for chunk in iter_typed_csv(csv_path, chunksize):
+            held_out = np.zeros(len(chunk), dtype=bool)
+            if holdout_every:
+                held_out = (offset + np.arange(len(chunk))) % holdout_every == 0
+            offset += len(chunk)
+            yield chunk[~held_out], chunk[held_out]
+
+    # Pass 1: imputation values, categories and classes
+    sketches = {column: QuantileSketch() for column in NUMERIC_COLUMNS}
+    category_counts = {column: Counter() for column in CATEGORICAL_COLUMNS}
+    label_counts = Counter()
+    for train, _ in chunks():
+        label_counts.update(clean_labels(train["classification"]))
+        for column in NUMERIC_COLUMNS:
+            if column in train.columns:
+                sketches[column].update(train[column].to_numpy())
+        for column in CATEGORICAL_COLUMNS:
+            if column in train.columns:
+                codes, categories = category_codes(train[column])
+                counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+                category_counts[column].update(dict(zip(categories, counts.tolist())))
+
+    classes = np.array(sorted(label_counts))
+    if len(classes) < 2:
+        raise ValueError(f"Training rows need at least two classes, found {classes.tolist()}")
+    n_rows = sum(label_counts.values())
+    categories, fill_values = {}, {}
+    for column in CATEGORICAL_COLUMNS:
+        categories[column] = sorted(category for category, count in category_counts[column].items() if count)
+        # Ties go to the first category in sorted order, as with pandas' mode()
+        mode = max(categories[column], key=category_counts[column].get, default=None)
+        fill_values[column] = float(categories[column].index(mode)) if mode is not None else 0.0
+    for column in NUMERIC_COLUMNS:
+        median = sketches[column].quantile(0.5)
+        fill_values[column] = 0.0 if median is None else median
+    log(f"Pass 1: {n_rows} training rows, classes {dict(zip(classes.tolist(), (label_counts[c] for c in classes)))} "
+        f"({time.perf_counter() - started:.1f}s)")
+
+    # Pass 2: scaler and SelectKBest scores
+    pipeline = FeaturePipeline(FEATURE_COLUMNS, categories, fill_values)
+    scaler = StandardScaler()
+    class_n = np.zeros(len(classes))
+    class_sum = np.zeros((len(classes), len(FEATURE_COLUMNS)))
+    class_sumsq = np.zeros((len(classes), len(FEATURE_COLUMNS)))
+    for train, _ in chunks():
+        X = pipeline.encode(train)
+        y = np.searchsorted(classes, clean_labels(train["classification"]))
+        scaler.partial_fit(X)
+        for label in range(len(classes)):
+            rows = X[y == label]
+            class_n[label] += len(rows)
+            class_sum[label] += rows.sum(axis=0)
+            class_sumsq[label] += np.square(rows).sum(axis=0)
+
+    selector = _fitted_selector(class_n, class_sum, class_sumsq, scaler, k)
+    pipeline = FeaturePipeline(FEATURE_COLUMNS, categories, fill_values, scaler, selector)
+    log(f"Pass 2: scaler and feature selection, kept {pipeline.selected_columns} "
+        f"({time.perf_counter() - started:.1f}s)")
+
+    # Pass 3: the forest, chunk by chunk
+    weights = n_rows / (len(classes) * class_n)
+    params = {**base_params, **forest_params, "class_weight": dict(enumerate(weights)), "warm_start": True}
+    n_estimators = params.pop("n_estimators")
+    model = RandomForestClassifier(**params, n_estimators=0)
+    rng = np.random.default_rng(params.get("random_state"))
+    sample_X, sample_y, sample_keys = None, None, np.empty(0)
+    pending_X, pending_y = [], []
+    fitted_rows = batches = 0
+    for train, _ in chunks():
+        X = pipeline.transform(train)
+        y = np.searchsorted(classes, clean_labels(train["classification"]))
+        pending_X.append(X)
+        pending_y.append(y)
+        fitted_rows += len(y)
+
+        # Uniform sample for the cascade: keep the rows with the smallest random keys
+        keys = np.concatenate([sample_keys, rng.random(len(y))])
+        keep = np.argsort(keys, kind="stable")[:cascade_sample_rows]
+        sample_X = X if sample_X is None else np.concatenate([sample_X, X])
+        sample_y = y if sample_y is None else np.concatenate([sample_y, y])
+        sample_X, sample_y, sample_keys = sample_X[keep], sample_y[keep], keys[keep]
+
+        trees = round(n_estimators * fitted_rows / n_rows)
+        batch_y = np.concatenate(pending_y)
+        if trees > model.n_estimators and len(np.unique(batch_y)) == len(classes):
+            model.n_estimators = trees
+            model.fit(np.concatenate(pending_X), batch_y)
+            pending_X, pending_y = [], []
+            batches += 1
+    if pending_y or model.n_estimators < n_estimators:
+        # Trailing rows of one class: fit the last trees on them plus the sample, which has every class
+        log(f"Pass 3: {sum(len(y) for y in pending_y)} trailing rows of one class fitted with the sample")
+        model.n_estimators = n_estimators
+        model.fit(np.concatenate(pending_X + [sample_X]), np.concatenate(pending_y + [sample_y]))
+        batches += 1
+    log(f"Pass 3: {len(model.estimators_)} trees from {batches} chunk batches "
+        f"({time.perf_counter() - started:.1f}s)")
+
+    # Pass 4: held-out rows
+    confusion = np.zeros((len(classes), len(classes)), dtype=np.int64)
+    for _, held_out in chunks():
+        if len(held_out):
+            y = np.searchsorted(classes, clean_labels(held_out["classification"]))
+            predicted = model.predict(pipeline.transform(held_out))
+            confusion += np.bincount(y * len(classes) + predicted,
+                                     minlength=len(classes) ** 2).reshape(len(classes), len(classes))
+    holdout_rows = int(confusion.sum())
+    report = {
+        "rows": n_rows,
+        "holdout_rows": holdout_rows,
+        "chunksize": chunksize,
+        "batches": batches,
+        "trees": len(model.estimators_),
+        "classes": classes.tolist(),
+        "fill_values": fill_values,
+        "selected_columns": pipeline.selected_columns,
+        "holdout_accuracy": float(np.trace(confusion) / holdout_rows) if holdout_rows else None,
+        "holdout_recall": (np.diag(confusion) / np.maximum(confusion.sum(axis=1), 1)).tolist(),
+        "confusion_matrix": confusion.tolist(),
+    }
+    log(f"Pass 4: {holdout_rows} held-out rows, accuracy {report['holdout_accuracy'] or 0:.4f} "
+        f"({time.perf_counter() - started:.1f}s)")
+
+    # The cascade's threshold is calibrated on the sample against forests of the same settings
+    cascade, calibration = fit_cascade(sample_X, sample_y, model, target_agreement=target_agreement)
+    report["cascade"] = calibration
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return model, pipeline, cascade, report
+
+
+def _fitted_selector(class_n, class_sum, class_sumsq, scaler, k):
+    """SelectKBest(f_classif) with the scores it would compute on the scaled training matrix."""
+    # Scaling a column does not change its F-score; zero-variance columns are scaled by 1 like StandardScaler
+    n = class_n.sum()
+    n_classes = len(class_n)
+    means = class_sum / class_n[:, None]
+    grand_mean = class_sum.sum(axis=0) / n
+    between = (class_n[:, None] * np.square(means - grand_mean)).sum(axis=0)
+    within = (class_sumsq - class_n[:, None] * np.square(means)).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = (between / (n_classes - 1)) / (np.maximum(within, 0.0) / (n - n_classes))
+    selector = SelectKBest(score_func=f_classif, k=min(k, len(scaler.mean_)))
+    selector.scores_ = scores
+    selector.pvalues_ = stats.f.sf(scores, n_classes - 1, n - n_classes)
+    selector.n_features_in_ = len(scaler.mean_)
+    return selector
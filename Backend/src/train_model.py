@@ -1,28 +1,59 @@
+import argparse
+import json
+import os
 import pickle
+
+import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 
-from preprocess_data import load_and_preprocess_data
-from feature_selection import apply_feature_selection
+from cascade import cascade_predict, fit_cascade
+from compiled_forest import CompiledForest
+from hyperparameter_search import format_report, run_search
+from dataset_cache import load_encoded, load_fitted_pipeline
+from feature_sweep import format_report as format_sweep_report, run_sweep
+from preprocess_data import load_raw_data
+from model_artifact import export_artifact, mmap_path_for
+from streaming_training import DEFAULT_CHUNK_SIZE, HOLDOUT_EVERY, train_out_of_core
+
+
+# Share of cascade-answered (out-of-fold) training rows that must match the forest
+CASCADE_TARGET_AGREEMENT = 0.999
+
+# Forest settings shared by every model; the tunable ones default to FOREST_PARAMS
+FOREST_BASE_PARAMS = {"random_state": 42, "class_weight": "balanced"}
+FOREST_PARAMS = {"n_estimators": 200, "max_depth": 15, "min_samples_split": 4, "min_samples_leaf": 2}
+
+# Columns SelectKBest keeps; python src/train_model.py --sweep-k reports accuracy and serving cost per k
+FEATURE_K = 15
+
+# Share of data/kidney_disease.csv held out as the test split (stratified, seed 42)
+TEST_SIZE = 0.2
+
+MODEL_PATH = "models/random_forest_ckd.pkl"
+SEARCH_REPORT_PATH = "models/hyperparameter_search.json"
+SWEEP_REPORT_PATH = "models/feature_sweep.json"
+
 
+def split_rows(y):
+    """Row indices ``(train_rows, test_rows)`` of the training/test split of a dataset's labels.
 
-def train_and_save_model():
-    X, y, scaler = load_and_preprocess_data("data/kidney_disease.csv")
-    X_selected, selector = apply_feature_selection(X, y, k=15)
+    Every script that trains on, or evaluates against, the test split of
+    data/kidney_disease.csv uses this, so they all hold out the same rows.
+    """
+    return train_test_split(np.arange(len(y)), test_size=TEST_SIZE, random_state=42, stratify=y)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_selected, y, test_size=0.2, random_state=42, stratify=y
-    )
 
-    model = RandomForestClassifier(
-        n_estimators=200, 
-        random_state=42,
-        class_weight='balanced',
-        max_depth=15,
-        min_samples_split=4,
-        min_samples_leaf=2
-    )
+def train_and_save_model(forest_params=None, k=FEATURE_K):
+    # One fitted pipeline (codes, imputation, scaling, selection) for training and serving
+    X_selected, y, pipeline = load_fitted_pipeline("data/kidney_disease.csv", k=k)
+
+    train_rows, test_rows = split_rows(y)
+    X_train, X_test = X_selected[train_rows], X_selected[test_rows]
+    y_train, y_test = y.iloc[train_rows], y.iloc[test_rows]
+
+    model = RandomForestClassifier(**FOREST_BASE_PARAMS, **(forest_params or FOREST_PARAMS))
     model.fit(X_train, y_train)
     
     # Quick evaluation
@@ -31,15 +62,117 @@ def train_and_save_model():
     print("\nQuick Evaluation on Test Set:")
     print(classification_report(y_test, y_pred, zero_division=0))
 
-    with open("models/random_forest_ckd.pkl", "wb") as f:
+    # Cheap first stage that answers confident cases before the forest is consulted
+    cascade, calibration = fit_cascade(X_train, y_train, model, target_agreement=CASCADE_TARGET_AGREEMENT)
+    if cascade is None:
+        print(f"\nNo cascade threshold reaches {CASCADE_TARGET_AGREEMENT:.1%} agreement, serving the forest only")
+    else:
+        compiled = CompiledForest.from_sklearn(model)
+        y_cascade, _, fallback = cascade_predict(
+            cascade, X_test, lambda X: (compiled.predict(X), compiled.predict_proba(X).max(axis=1)))
+        print(f"\nCascade threshold {cascade.threshold:.4f} "
+              f"(calibration coverage {calibration['calibration_coverage']:.1%})")
+        print(f"Test set: fallback rate {fallback.mean():.1%}, "
+              f"agreement with forest {(y_cascade == y_pred).mean():.1%}")
+
+    save_model(model, pipeline, cascade)
+    print("\nModel trained and saved successfully!")
+
+
+def save_model(model, pipeline, cascade, path=MODEL_PATH):
+    """Write the artifact app.py loads: the pickle and its memory-mappable copy."""
+    # Write to a temporary file and rename, so a running API never reads a partial artifact
+    with open(f"{path}.tmp", "wb") as f:
         pickle.dump({
             "model": model,
-            "scaler": scaler,
-            "selector": selector
+            "scaler": pipeline.scaler,
+            "selector": pipeline.selector,
+            "pipeline": pipeline,
+            "cascade": cascade
         }, f)
+    os.replace(f"{path}.tmp", path)
 
-    print("\nModel trained and saved successfully!")
+    # Memory-mappable copy that the API workers share
+    export_artifact(path, mmap_path_for(path))
+
+
+def train_out_of_core_and_save_model(csv_path, chunksize=DEFAULT_CHUNK_SIZE, k=FEATURE_K):
+    """Train on a CSV too large for memory, streaming it in chunks, and save the usual artifact."""
+    model, pipeline, cascade, report = train_out_of_core(
+        csv_path, FOREST_BASE_PARAMS, FOREST_PARAMS, k=k, chunksize=chunksize,
+        target_agreement=CASCADE_TARGET_AGREEMENT)
+
+    print("Training completed!")
+    print(f"\nHeld-out rows (every {HOLDOUT_EVERY}th): {report['holdout_rows']}, "
+          f"accuracy {report['holdout_accuracy']:.4f}")
+    for label, recall in enumerate(report["holdout_recall"]):
+        print(f"  class {label} recall {recall:.4f}")
+    if cascade is None:
+        print(f"\nNo cascade threshold reaches {CASCADE_TARGET_AGREEMENT:.1%} agreement, serving the forest only")
+    else:
+        print(f"\nCascade threshold {cascade.threshold:.4f} "
+              f"(calibration coverage {report['cascade']['calibration_coverage']:.1%} "
+              f"on {report['cascade']['calibration_rows']} sampled rows)")
+
+    save_model(model, pipeline, cascade)
+    print(f"\nModel trained on {report['rows']} rows in {report['seconds']:.1f}s and saved successfully!")
+
+
+def search_and_save_model(workers=None, k=FEATURE_K):
+    """Cross-validate the parameter grid on the training split, then train the chosen forest."""
+    features, y = load_raw_data("data/kidney_disease.csv")
+
+    # Same rows train_and_save_model holds out, so the test split stays unseen by the search
+    train_rows, _ = split_rows(y)
+    report = run_search(features.iloc[train_rows], y.iloc[train_rows], FOREST_BASE_PARAMS,
+                        workers=workers, k=k)
+
+    print(format_report(report))
+    with open(SEARCH_REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSearch report written to {SEARCH_REPORT_PATH}")
+    print(f"Training with {report['chosen']['params']}\n")
+
+    train_and_save_model(report["chosen"]["params"], k=k)
+
+
+def sweep_feature_count(workers=None):
+    """Cross-validate every SelectKBest k on the training split and report accuracy against serving cost."""
+    X, y, categories = load_encoded("data/kidney_disease.csv")
+
+    # Same rows train_and_save_model holds out, so the test split stays unseen by the sweep
+    train_rows, _ = split_rows(y)
+    report = run_sweep(X[train_rows], y.to_numpy()[train_rows], categories, FOREST_BASE_PARAMS, FOREST_PARAMS,
+                       workers=workers)
+
+    print(format_sweep_report(report))
+    with open(SWEEP_REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSweep report written to {SWEEP_REPORT_PATH}")
+    print(f"Train with it: python src/train_model.py --k {report['chosen_k']} (currently FEATURE_K = {FEATURE_K})")
 
 
 if __name__ == "__main__":
-    train_and_save_model()
+    parser = argparse.ArgumentParser(description="Train the CKD random forest")
+    parser.add_argument("--search", action="store_true",
+                        help="pick forest parameters with a parallel cross-validated search first")
+    parser.add_argument("--sweep-k", action="store_true",
+                        help="report cross-validated accuracy and serving cost for every SelectKBest k, then stop")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="search or sweep processes (default: CPU count)")
+    parser.add_argument("--k", type=int, default=FEATURE_K, help=f"features kept (default {FEATURE_K})")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="stream the CSV in chunks instead of loading it, for files larger than memory")
+    parser.add_argument("--csv", default="data/kidney_disease.csv", help="training CSV for --out-of-core")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"rows per chunk with --out-of-core (default {DEFAULT_CHUNK_SIZE})")
+    args = parser.parse_args()
+
+    if args.sweep_k:
+        sweep_feature_count(workers=args.workers)
+    elif args.out_of_core:
+        train_out_of_core_and_save_model(args.csv, chunksize=args.chunk_size, k=args.k)
+    elif args.search:
+        search_and_save_model(workers=args.workers, k=args.k)
+    else:
+        train_and_save_model(k=args.k)
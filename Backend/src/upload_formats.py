@@ -0,0 +1,170 @@
+import gzip
+import bz2
+import lzma
+import os
+import zipfile
+import zlib
+
+import pandas as pd
+
+from feature_pipeline import FEATURE_COLUMNS
+
+
+# Accepted upload extensions -> (format, compression)
+UPLOAD_FORMATS = {
+    '.csv': ('csv', None),
+    '.csv.gz': ('csv', 'gzip'),
+    '.csv.bz2': ('csv', 'bz2'),
+    '.csv.xz': ('csv', 'xz'),
+    '.csv.zip': ('csv', 'zip'),
+    '.parquet': ('parquet', None),
+    '.pq': ('parquet', None),
+    '.arrow': ('arrow', None),
+    '.ipc': ('arrow', None),
+    '.feather': ('arrow', None),
+}
+
+
+class UploadFormatError(ValueError):
+    """Raised for uploads that are not in a supported format or hold no feature columns."""
+
+
+def upload_extension(filename):
+    """The supported extension a file name ends with (e.g. ``.csv.gz``), or raise UploadFormatError."""
+    name = (filename or '').lower()
+    for extension in sorted(UPLOAD_FORMATS, key=len, reverse=True):
+        if name.endswith(extension):
+            return extension
+    accepted = ', '.join(sorted(UPLOAD_FORMATS))
+    raise UploadFormatError(f'File must be one of: {accepted}')
+
+
+def upload_format(filename):
+    """``(format, compression)`` for an upload's file name, or raise UploadFormatError."""
+    return UPLOAD_FORMATS[upload_extension(filename)]
+
+
+def read_upload(source, filename, columns=None):
+    """Read an uploaded file into a DataFrame holding only the feature columns it contains."""
+    chunks = list(iter_upload_chunks(source, filename, chunksize=None, columns=columns))
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+
+def iter_upload_chunks(source, filename, chunksize=None, columns=None):
+    """Yield DataFrames of at most ``chunksize`` rows (all rows if None) from an upload.
+
+    Only the feature columns are parsed: CSV readers skip the other columns and
+    Parquet/Arrow readers never decode them. Columnar data is converted to
+    pandas column by column without an intermediate CSV-style text parse.
+    A corrupt or truncated compressed file raises UploadFormatError.
+    """
+    file_format, compression = upload_format(filename)
+    try:
+        yield from _iter_chunks(source, file_format, compression, chunksize, columns)
+    except (OSError, EOFError, zipfile.BadZipFile, zlib.error, lzma.LZMAError) as e:
+        # gzip.BadGzipFile and bz2 errors are OSErrors, damaged deflate data is a zlib.error
+        # and a truncated stream ends in EOFError
+        raise UploadFormatError(f'File is corrupt or truncated: {e}') from e
+
+
+def _iter_chunks(source, file_format, compression, chunksize, columns):
+    wanted = set(columns or FEATURE_COLUMNS)
+
+    if file_format == 'csv':
+        reader = pd.read_csv(source, compression=compression, usecols=lambda column: column in wanted,
+                             chunksize=chunksize)
+        if chunksize is None:
+            _check_columns(reader.columns)
+            yield reader
+            return
+        first = True
+        for chunk in reader:
+            if first:
+                _check_columns(chunk.columns)
+                first = False
+            yield chunk
+        return
+
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(source)
+        present = [name for name in parquet.schema_arrow.names if name in wanted]
+        _check_columns(present)
+        if chunksize is None:
+            yield _to_pandas(parquet.read(columns=present))
+            return
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=present):
+            yield _to_pandas(batch)
+        return
+
+    reader = _open_ipc(source)
+    present = [name for name in reader.schema.names if name in wanted]
+    _check_columns(present)
+    if chunksize is None:
+        yield _to_pandas(reader.read_all().select(present))
+        return
+    for batch in _ipc_batches(reader):
+        batch = batch.select(present)
+        for offset in range(0, batch.num_rows, chunksize):
+            yield _to_pandas(batch.slice(offset, chunksize))
+
+
+def count_upload_rows(path, filename=None):
+    """Count data rows in an upload on disk without parsing the values."""
+    file_format, compression = upload_format(filename or path)
+
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    if file_format == 'arrow':
+        return sum(batch.num_rows for batch in _ipc_batches(_open_ipc(path)))
+
+    openers = {None: open, 'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+    if compression == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            with archive.open(archive.namelist()[0]) as f:
+                return _count_lines(f)
+    with openers[compression](path, 'rb') as f:
+        return _count_lines(f)
+
+
+def _count_lines(f):
+    """Count data rows (excluding the header) of a CSV stream."""
+    newlines = 0
+    last_byte = b''
+    for block in iter(lambda: f.read(1 << 20), b''):
+        newlines += block.count(b'\n')
+        last_byte = block[-1:]
+    if last_byte and last_byte != b'\n':
+        newlines += 1
+    return max(newlines - 1, 0)
+
+
+def _check_columns(present):
+    if not any(column in FEATURE_COLUMNS for column in present):
+        raise UploadFormatError('File has none of the expected feature columns')
+
+
+def _open_ipc(source):
+    import pyarrow as pa
+    if isinstance(source, (str, os.PathLike)):
+        source = pa.memory_map(os.fspath(source))
+    # Arrow IPC comes in a random-access file format and a streaming format
+    start = source.tell()
+    try:
+        return pa.ipc.open_file(source)
+    except pa.ArrowInvalid:
+        source.seek(start)
+        return pa.ipc.open_stream(source)
+
+
+def _ipc_batches(reader):
+    if hasattr(reader, 'num_record_batches'):
+        for index in range(reader.num_record_batches):
+            yield reader.get_batch(index)
+    else:
+        yield from reader
+
+
+def _to_pandas(data):
+    return data.to_pandas(split_blocks=True)
@@ -0,0 +1,104 @@
+"""
+Script to test the batch upload endpoints with a small CSV that has invalid rows.
+Checks that invalid rows come back as errors, that the validation summary
+(invalid row count and errors per column) is reported, and that the streamed
+CSV body parses from header to summary line.
+
+Usage:
+    python test_batch_upload.py <your_token>
+"""
+import csv
+import io
+import json
+import sys
+import time
+
+import requests
+
+# Backend API URL
+API_URL = 'http://localhost:5000/api/predict-batch'
+
+# Four rows: one valid, one with an out-of-range sodium, one with a non-numeric
+# potassium and sodium, and one with an unknown red blood cell category
+SAMPLE_CSV = (
+    'age,bp,sg,al,su,rbc,pc,pcc,ba,bgr,bu,sc,sod,pot,hemo,pcv,wc,rc,htn,dm,cad,appet,pe,ane\n'
+    '35,70,1.025,0,0,normal,normal,notpresent,notpresent,100,25,0.8,140,4.0,15.0,45,8000,5.5,no,no,no,good,no,no\n'
+    '70,100,1.005,4,3,abnormal,abnormal,present,present,250,140,5.2,900,6.0,8.0,24,12000,3.2,yes,yes,yes,poor,yes,yes\n'
+    '42,80,1.020,0,0,normal,normal,notpresent,notpresent,95,30,0.9,high,low,14.5,44,7500,5.2,no,no,no,good,no,no\n'
+    '55,90,1.010,2,0,weird,normal,notpresent,notpresent,140,60,2.1,135,4.5,11.0,35,9000,4.1,yes,no,no,good,no,no\n'
+)
+
+EXPECTED_VALIDATION = {
+    'invalid_rows': 3,
+    'columns': {
+        'rbc': {'unknown category': 1},
+        'sod': {'out of range': 1, 'not a number': 1},
+        'pot': {'not a number': 1},
+    }
+}
+
+
+def upload(token, url):
+    headers = {'Authorization': f'Bearer {token}'}
+    files = {'file': (f'batch_{time.time_ns()}.csv', SAMPLE_CSV, 'text/csv')}
+    return requests.post(url, files=files, headers=headers)
+
+
+def test_validation_summary(token):
+    """The batch response reports the invalid rows and their errors per column"""
+    response = upload(token, API_URL)
+    assert response.status_code == 200, f"{response.status_code} - {response.text}"
+    body = response.json()
+
+    predictions = [result['prediction'] for result in body['results']]
+    assert predictions[0] != 'Error' and predictions[1:] == ['Error'] * 3, predictions
+    assert body['summary']['errors'] == 3, body['summary']
+    assert body['validation'] == EXPECTED_VALIDATION, body['validation']
+    print(f"✅ /api/predict-batch validation: {body['validation']}")
+
+
+def test_stream_validation_summary(token):
+    """The NDJSON stream's summary line carries the same validation summary"""
+    response = upload(token, f'{API_URL}/stream?format=ndjson')
+    assert response.status_code == 200, f"{response.status_code} - {response.text}"
+    summary = json.loads(response.text.splitlines()[-1])['summary']
+    assert summary['validation'] == EXPECTED_VALIDATION, summary['validation']
+    print(f"✅ /api/predict-batch/stream validation: {summary['validation']}")
+
+
+def test_stream_csv_body(token):
+    """The whole CSV stream parses: one header, one row per upload row, then the summary line"""
+    response = upload(token, f'{API_URL}/stream?format=csv')
+    assert response.status_code == 200, f"{response.status_code} - {response.text}"
+    body = response.text
+    assert '\r' not in body, "CSV stream mixes line terminators"
+
+    lines = body.split('\n')
+    assert lines[-1] == '', "CSV stream does not end with a newline"
+    summary_line = lines[-2]
+    assert summary_line.startswith('# summary '), summary_line
+    summary = dict(field.split('=', 1) for field in summary_line[len('# summary '):].split(','))
+
+    rows = list(csv.DictReader(io.StringIO('\n'.join(lines[:-2]) + '\n')))
+    assert [row['id'] for row in rows] == ['1', '2', '3', '4'], rows
+    assert [row['prediction'] == 'Error' for row in rows] == [False, True, True, True], rows
+    assert all(None not in row for row in rows), "a row has more fields than the header"
+    assert summary['total'] == '4' and summary['errors'] == '3', summary
+    assert summary['invalid_rows'] == '3', summary
+    print(f"✅ /api/predict-batch/stream CSV: {len(rows)} rows, summary {summary}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python test_batch_upload.py <your_token>")
+        print("Copy the 'token' value from localStorage after logging in to the frontend.")
+        exit(1)
+
+    token = sys.argv[1]
+    try:
+        test_validation_summary(token)
+        test_stream_validation_summary(token)
+        test_stream_csv_body(token)
+    except requests.exceptions.ConnectionError:
+        print(f"\n⚠️ Cannot connect to API. Make sure backend is running on {API_URL}")
+        exit(1)
@@ -0,0 +1,75 @@
+"""
+Numeric parsing parity test: a value sent to /api/predict (one dict) and the
+same value in an uploaded batch (a DataFrame column) must encode to the same
+number, and batch validation must reject exactly the values both paths treat
+as not-a-number. Runs without the API or a trained model.
+
+Usage:
+    python test_numeric_parsing.py
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Add src to path
+sys.path.insert(0, 'src')
+
+from feature_pipeline import FeaturePipeline
+from input_validation import TYPE_ERROR, validate_frame
+
+FILL = 140.0
+
+# Raw sodium value -> encoded value (FILL when it is imputed) and whether validation rejects it
+CASES = [
+    ('135', 135.0, False),
+    (' 135 ', 135.0, False),
+    ('\t135\n', 135.0, False),
+    ('1.35e2', 135.0, False),
+    (135, 135.0, False),
+    (135.5, 135.5, False),
+    ('?', FILL, False),
+    (' ? ', FILL, False),
+    ('\t?', FILL, False),
+    ('', FILL, False),
+    ('   ', FILL, False),
+    (None, FILL, False),
+    (np.nan, FILL, False),
+    ('1_000', FILL, True),
+    ('1_35', FILL, True),
+    ('١٣٥', FILL, True),
+    ('abc', FILL, True),
+    ('1,000', FILL, True),
+    (True, FILL, True),
+]
+
+
+def main():
+    pipeline = FeaturePipeline(columns=['sod'], fill_values={'sod': FILL})
+    values = [value for value, _, _ in CASES]
+    expected = np.array([encoded for _, encoded, _ in CASES])
+
+    single = np.array([pipeline.transform({'sod': value})[0, 0] for value in values])
+    batch = pipeline.transform(pd.DataFrame({'sod': pd.Series(values, dtype=object)}))[:, 0]
+    # Uploads only ever hold strings in a column that has any non-number in it
+    strings = [value for value in values if isinstance(value, str)]
+    batch_strings = pipeline.transform(pd.DataFrame({'sod': pd.Series(strings, dtype='string')}))[:, 0]
+
+    validation = validate_frame(pd.DataFrame({'sod': pd.Series(values, dtype=object)}), ranges={}, columns=['sod'])
+    rejected = validation.codes[:, 0] == TYPE_ERROR
+
+    failures = 0
+    for position, (value, encoded, should_reject) in enumerate(CASES):
+        ok = single[position] == encoded and batch[position] == encoded and rejected[position] == should_reject
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {value!r:>12}  single={single[position]:<7} batch={batch[position]:<7} "
+              f"rejected={bool(rejected[position])}")
+
+    string_expected = np.array([encoded for value, encoded, _ in CASES if isinstance(value, str)])
+    assert np.array_equal(batch_strings, string_expected), f"string column differs: {batch_strings}"
+    assert failures == 0, f"{failures} values parse differently between the single and batch paths"
+    print(f"\nAll {len(CASES)} values parse the same way on the single, batch and validation paths")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,8 +8,7 @@ import numpy as np
 import sys
 sys.path.insert(0, 'src')
 
-from preprocess_data import load_and_preprocess_data
-from feature_selection import apply_feature_selection
+from dataset_cache import load_preprocessed
 
 
 # Load model
@@ -21,8 +20,7 @@ scaler = loaded.get('scaler')
 selector = loaded.get('selector')
 
 # Load data
-X, y, _ = load_and_preprocess_data('data/kidney_disease.csv')
-X_selected, _ = apply_feature_selection(X, y, k=15)
+X, y, _, X_selected, _ = load_preprocessed('data/kidney_disease.csv', k=15)
 
 # Load raw CSV for patient info
 df = pd.read_csv('data/kidney_disease.csv')
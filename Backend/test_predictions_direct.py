@@ -11,8 +11,7 @@ import os
 # Add src to path
 sys.path.insert(0, 'src')
 
-from preprocess_data import load_and_preprocess_data
-from feature_selection import apply_feature_selection
+from dataset_cache import load_preprocessed
 
 
 def load_model():
@@ -152,8 +151,7 @@ def main():
     
     # Load dataset for preprocessing reference
     print("Loading dataset preprocessing info...")
-    X, y, _ = load_and_preprocess_data('data/kidney_disease.csv')
-    X_selected, _ = apply_feature_selection(X, y, k=15)
+    X, y, _, X_selected, _ = load_preprocessed('data/kidney_disease.csv', k=15)
     
     correct_predictions = 0
     total_predictions = 0